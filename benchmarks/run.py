@@ -0,0 +1,335 @@
+"""
+Benchmarks of the pipeline stages on synthetic data
+
+    python -m benchmarks.run run --grid small --output baseline.json
+    python -m benchmarks.run compare baseline.json current.json --threshold 0.25
+
+run times every stage (wall time and peak resident memory sampled by
+koan.instrument.measure, above the memory of the process at the start of
+the stage, data_mb being the size of the features as float32 for reference)
+for each dataset size of the grid, and the import time of the package entry
+points, and stores the results with the library versions as json. The
+stages a selected stage depends on are run (and reported) too. compare
+reports the ratios between two such files and exits with 1 when a stage got
+slower or bigger than the threshold.
+"""
+
+import gc
+import os
+import sys
+import json
+import argparse
+import platform
+import subprocess
+import tempfile
+from importlib import metadata
+from importlib.util import find_spec
+
+from koan.borda_importance import borda_importance_scores
+from koan.correlation import correlation_matrix
+from koan.cross_validation import cross_val_exp
+from koan.embeddings import compute_embeddings
+from koan.instrument import measure
+from koan.prefix_scan import KNNPrefixScan, LDAPrefixScan
+from koan.preprocess import preprocess
+from koan.pycaret import exec_pycaret
+from koan.render import render
+from koan.sampling import sampling
+from .synthetic import write_csv
+
+TAGNAME = "anyadr"
+TAG_VALS = {0: "No", 1: "Yes"}
+# (rows, features) of the benchmarked datasets
+GRIDS = {
+    "small": [(1000, 20), (5000, 50)],
+    "medium": [(20000, 100), (50000, 200)],
+    "large": [(200000, 200), (1000000, 300)],
+}
+# Models compared by the exec_pycaret stage, a fixed shortlist so that the
+# runs stay comparable
+PYCARET_OPTIONS = {"include": ["lr", "dt", "lightgbm"], "fold": 3}
+# Modules whose cold import time is measured, heavy dependencies must not
+# be imported with them
+IMPORTS = ["koan.cli", "koan.workflows"]
+PACKAGES = [
+    "numpy",
+    "pandas",
+    "scikit-learn",
+    "scipy",
+    "xgboost",
+    "lightgbm",
+    "catboost",
+    "umap-learn",
+    "imbalanced-learn",
+    "pycaret",
+    "matplotlib",
+    "seaborn",
+]
+
+
+def _stages(csvfile, int_columns, results_path, dpi):
+    """(name, stages it depends on, function of the state dict) in execution order"""
+    plot_kwargs = {"sampling_type": "bench", "results_path": results_path, "dpi": dpi}
+    return [
+        ("preprocess", (), lambda s: preprocess(csvfile, int_columns, TAGNAME, "no")),
+        (
+            "sampling/undersampling",
+            ("preprocess",),
+            lambda s: sampling(
+                s["preprocess"], tag_name=TAGNAME, typos="undersampling"
+            ),
+        ),
+        (
+            "sampling/smote",
+            ("preprocess",),
+            lambda s: sampling(s["preprocess"], tag_name=TAGNAME, typos="smote"),
+        ),
+        (
+            "exec_pycaret",
+            ("preprocess",),
+            lambda s: exec_pycaret(
+                s["preprocess"], TAGNAME, "bench", results_path, **PYCARET_OPTIONS
+            ),
+        ),
+        (
+            "borda_importance",
+            ("preprocess",),
+            lambda s: borda_importance_scores(s["preprocess"], TAGNAME),
+        ),
+        (
+            "cross_val_exp/LDA",
+            ("borda_importance",),
+            lambda s: cross_val_exp(s["borda_importance"], "LDA", LDAPrefixScan()),
+        ),
+        (
+            "cross_val_exp/KNN",
+            ("borda_importance",),
+            lambda s: cross_val_exp(s["borda_importance"], "KNN", KNNPrefixScan(10)),
+        ),
+        (
+            "embeddings",
+            ("preprocess",),
+            lambda s: compute_embeddings(s["preprocess"], TAGNAME),
+        ),
+        ("correlation", ("preprocess",), lambda s: correlation_matrix(s["preprocess"])),
+        (
+            "plot_dimensionality_reduction",
+            ("embeddings",),
+            lambda s: render(
+                "plot_dimensionality_reduction",
+                df=None,
+                embeddings=s["embeddings"],
+                tag_vals=TAG_VALS,
+                tagname=TAGNAME,
+                **plot_kwargs,
+            ),
+        ),
+        (
+            "plot_correlation_heatmap",
+            ("correlation",),
+            lambda s: render(
+                "plot_correlation_heatmap",
+                df=None,
+                corr_matrix=s["correlation"],
+                **plot_kwargs,
+            ),
+        ),
+        (
+            "plot_borda_importance",
+            ("borda_importance",),
+            lambda s: render(
+                "plot_borda_importance",
+                borda_results=s["borda_importance"]["borda_importance"],
+                **plot_kwargs,
+            ),
+        ),
+        (
+            "plot_boxplot_metrics",
+            ("cross_val_exp/LDA",),
+            lambda s: render(
+                "plot_boxplot_metrics",
+                cross_val_data=s["cross_val_exp/LDA"],
+                **plot_kwargs,
+            ),
+        ),
+    ]
+
+
+def _with_deps(stages, selected):
+    """Names of the selected stages and of the stages they depend on"""
+    deps = {name: stage_deps for name, stage_deps, _ in stages}
+    needed, todo = set(), [name for name in deps if name in selected]
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(deps[name])
+    return needed
+
+
+def _measure(func, state):
+    gc.collect()
+    result, record = measure(func, (state,))
+    return result, record["duration"], record["peak_rss_mb"] - record["rss_start_mb"]
+
+
+def run_benchmarks(grid, selected=None, dpi=100, minority_ratio=0.2, int_share=0.3):
+    """
+    One {"stage", "rows", "features", "seconds", "peak_mb", "data_mb"} dict
+    per measurement, exec_pycaret being skipped when PyCaret is not installed
+    """
+    results = []
+    for n_rows, n_features in grid:
+        with tempfile.TemporaryDirectory() as workdir:
+            csvfile = os.path.join(workdir, "data.csv")
+            int_columns = write_csv(
+                csvfile,
+                n_rows=n_rows,
+                n_features=n_features,
+                minority_ratio=minority_ratio,
+                int_share=int_share,
+            )
+            stages = _stages(csvfile, int_columns, workdir, dpi)
+            needed = _with_deps(stages, selected) if selected else None
+            state = {}
+            for name, _, func in stages:
+                if needed is not None and name not in needed:
+                    continue
+                if name == "exec_pycaret" and find_spec("pycaret") is None:
+                    print(f"{name:32} skipped, PyCaret is not installed", flush=True)
+                    continue
+                state[name], seconds, peak_mb = _measure(func, state)
+                results.append(
+                    {
+                        "stage": name,
+                        "rows": n_rows,
+                        "features": n_features,
+                        "seconds": seconds,
+                        "peak_mb": peak_mb,
+                        "data_mb": n_rows * n_features * 4 / 1024**2,
+                    }
+                )
+                print(
+                    f"{name:32} {n_rows:>8} x {n_features:<4} "
+                    f"{seconds:9.2f}s {peak_mb:9.1f}MB",
+                    flush=True,
+                )
+    return results
+
+
+def import_seconds(module, repeat=3):
+    """Best of repeat cold imports of module, each in a fresh interpreter"""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    return min(
+        float(subprocess.check_output([sys.executable, "-c", code], text=True))
+        for _ in range(repeat)
+    )
+
+
+def run_imports(selected=None):
+    results = []
+    for module in IMPORTS:
+        name = f"import {module}"
+        if selected and name not in selected:
+            continue
+        seconds = import_seconds(module)
+        results.append(
+            {"stage": name, "rows": 0, "features": 0, "seconds": seconds, "peak_mb": 0}
+        )
+        print(f"{name:32} {seconds:27.2f}s", flush=True)
+    return results
+
+
+def _versions():
+    versions = {"python": platform.python_version(), "platform": platform.platform()}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def _ratio(new, old, floor):
+    """new / old, None when both are below floor (mostly measurement noise)"""
+    if max(new, old) < floor:
+        return None
+    # Import entries have no memory measurement
+    return new / old if old else 1.0
+
+
+def compare(baseline, current, threshold=0.25, min_seconds=0.1, min_mb=16):
+    """
+    Print the current / baseline ratios of the stages found in both files,
+    returns the number of regressions (ratio above 1 + threshold)
+    min_seconds, min_mb: times and memory sizes below which (in both files)
+                         the ratio is not compared
+    """
+    key = lambda entry: (entry["stage"], entry["rows"], entry["features"])
+    base = {key(entry): entry for entry in baseline["results"]}
+    floors = {"seconds": min_seconds, "peak_mb": min_mb}
+    regressions = 0
+    for entry in current["results"]:
+        if key(entry) not in base:
+            continue
+        old = base[key(entry)]
+        ratios = [
+            _ratio(entry[metric], old[metric], floor)
+            for metric, floor in floors.items()
+        ]
+        flag = ""
+        if any(ratio is not None and ratio > 1 + threshold for ratio in ratios):
+            regressions += 1
+            flag = "  REGRESSION"
+        time_ratio, memory_ratio = (
+            "    -" if ratio is None else f"{ratio:5.2f}" for ratio in ratios
+        )
+        print(
+            f"{entry['stage']:32} {entry['rows']:>8} x {entry['features']:<4} "
+            f"time x{time_ratio} memory x{memory_ratio}{flag}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="benchmark the stages")
+    run.add_argument("--grid", choices=GRIDS, default="small")
+    run.add_argument("--stages", nargs="*", help="only these stages")
+    run.add_argument("--dpi", type=int, default=100)
+    run.add_argument("--output", default="benchmark.json")
+    cmp = commands.add_parser("compare", help="compare two benchmark files")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.25)
+    cmp.add_argument("--min-seconds", type=float, default=0.1)
+    cmp.add_argument("--min-mb", type=float, default=16)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run_imports(args.stages)
+        results += run_benchmarks(GRIDS[args.grid], args.stages, args.dpi)
+        with open(args.output, "w") as fh:
+            json.dump(
+                {"grid": args.grid, "versions": _versions(), "results": results},
+                fh,
+                indent=2,
+            )
+        return 0
+
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)
+    with open(args.current) as fh:
+        current = json.load(fh)
+    regressions = compare(
+        baseline, current, args.threshold, args.min_seconds, args.min_mb
+    )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+Deterministic synthetic datasets for the benchmarks
+
+Imbalanced binary tabular data shaped like the cohort csv files: a row
+index, float features, a share of integer coded features and the tag column.
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.datasets import make_classification
+
+
+def make_dataset(
+    n_rows=1000,
+    n_features=20,
+    minority_ratio=0.2,
+    int_share=0.3,
+    tagname="anyadr",
+    random_state=0,
+):
+    """
+    n_rows, n_features: size of the dataset (the tag column not counted)
+    minority_ratio: share of the rows in the positive class
+    int_share: share of the features that are integer coded
+    Returns (df, int_columns), int_columns including tagname
+    """
+    X, y = make_classification(
+        n_samples=n_rows,
+        n_features=n_features,
+        n_informative=max(2, n_features // 4),
+        n_redundant=max(0, n_features // 10),
+        weights=[1 - minority_ratio],
+        flip_y=0.01,
+        random_state=random_state,
+    )
+    df = pd.DataFrame(X, columns=[f"feature_{i}" for i in range(n_features)])
+    n_int = int(round(int_share * n_features))
+    int_columns = list(df.columns[:n_int])
+    # Integer codes with a few levels, like the categorical cohort variables
+    for column in int_columns:
+        df[column] = np.digitize(df[column], [-1, 0, 1]).astype(np.int64)
+    df[tagname] = y
+    return df, int_columns + [tagname]
+
+
+def write_csv(path, **kwargs):
+    """make_dataset(**kwargs) written as a csv, returns int_columns"""
+    df, int_columns = make_dataset(**kwargs)
+    df.to_csv(path)
+    return int_columns
@@ -0,0 +1,343 @@
+"""
+Batch mode: one cohort analysed against several target columns
+
+The csv is parsed once. The target-independent artifacts, the correlation
+matrix of the features and their unlabelled embeddings, are computed once
+and shared; each (target, sampling method) pair gets its own resampling,
+PyCaret, Borda importance and cross validation chain, all of them scheduled
+on one worker pool. The other targets are never used as features.
+The results of every target are under <results_path>/<target>, and one row
+per (target, sampling method, classifier) is written to
+<results_path>/results_index.csv.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from .cache import StageCache, file_digest, stage_key
+from .correlation import correlation_matrix
+from .embeddings import compute_embeddings
+from .ingest import columnar_cache, load_columnar
+from .instrument import write_manifest
+from .render import RenderQueue
+from .sampling import sample_indices, sampling
+from .scheduler import Stage, run_stages
+from .store import new_run_id, store_run
+from .workflows import _cached_stage, _plot_stage, _store_stage, model_stages
+
+INDEX_FILE = "results_index.csv"
+
+
+def _features(dataset, targets):
+    return load_columnar(dataset).drop(columns=targets)
+
+
+def _target_dataset(dataset, targets, target, sampling_method, random_state=42):
+    """The rows labelled for target, without the other targets, resampled"""
+    df = load_columnar(dataset)
+    columns = [i for i, c in enumerate(df.columns) if c == target or c not in targets]
+    labelled = np.flatnonzero(df[target].notna().to_numpy())
+    if sampling_method == "smote":
+        return sampling(
+            df.iloc[labelled, columns],
+            tag_name=target,
+            typos=sampling_method,
+            random_state=random_state,
+        )
+    # Labelled and resampled rows selected together, df is indexed once
+    y = df[target].to_numpy()[labelled]
+    rows = labelled[sample_indices(y, sampling_method, random_state)]
+    return df.iloc[rows, columns]
+
+
+def _label_embeddings(embeddings, dataset, target):
+    """The shared embeddings coloured by target"""
+    labels = np.asarray(load_columnar(dataset)[target])
+    rows = embeddings["rows"]
+    return {**embeddings, "labels": labels if rows is None else labels[rows]}
+
+
+def batch_stages(
+    *,
+    csvfile,
+    targets,
+    tag_vals,
+    results_path,
+    int_columns,
+    classifiers,
+    sampling_methods=("no",),
+    n_jobs=1,
+    search="full",
+    cache_dir=None,
+    ingest_dir=None,
+    dpi=600,
+    fmt="png",
+    render_queue=None,
+    pycaret_options=None,
+    stability_options=None,
+    fold_options=None,
+    voters=("native",),
+    random_state=42,
+    store_dir=None,
+    run_id=None,
+):
+    """
+    The batch as a list of scheduler stages: "dataset", "correlation",
+    "embeddings" and their figures, then "<target>/<sampling_method>/<stage>"
+    ingest_dir: directory of the columnar copy of the csv shared by the
+                stages (<results_path>/ingest if None)
+    run_id: run the outputs are stored under in store_dir
+    Other arguments as in batch.
+    """
+    cache = StageCache(cache_dir) if cache_dir is not None else None
+    ingest_dir = ingest_dir or os.path.join(results_path, "ingest")
+    data_key = stage_key(file_digest(csvfile), int_columns, targets)
+    plot_kwargs = {"render_queue": render_queue, "dpi": dpi, "fmt": fmt}
+    store_kwargs = None
+    if store_dir is not None:
+        store_kwargs = {"root": store_dir, "run": run_id}
+
+    stages = [
+        # Parsed once into the columnar cache of ingest_dir, the other stages
+        # get its directory and memory-map the columns instead of being sent
+        # a pickled copy of the cohort
+        Stage(
+            "dataset",
+            columnar_cache,
+            kwargs={
+                "csvfile": csvfile,
+                "cache_dir": ingest_dir,
+                "int_columns": int_columns,
+            },
+        ),
+        Stage(
+            "features",
+            _features,
+            kwargs={"targets": targets},
+            deps={"dataset": "dataset"},
+        ),
+        Stage(
+            "correlation",
+            _cached_stage,
+            (cache, "correlation", data_key, correlation_matrix),
+            deps={"df": "features"},
+        ),
+        _plot_stage(
+            "plot_correlation_heatmap",
+            "plot_correlation_heatmap",
+            {"corr_matrix": "correlation"},
+            **plot_kwargs,
+            df=None,
+            sampling_type="all",
+            results_path=results_path,
+        ),
+        Stage(
+            "embeddings",
+            _cached_stage,
+            (cache, "embeddings", data_key, compute_embeddings),
+            {"tagname": None},
+            {"df": "features"},
+        ),
+    ]
+    if store_kwargs is not None:
+        stages.append(
+            _store_stage(
+                "correlation",
+                "correlation",
+                {**store_kwargs, "target": None},
+                sampling="all",
+            )
+        )
+
+    for target in targets:
+        target_path = os.path.join(results_path, target)
+        stages += [
+            Stage(
+                f"{target}/embeddings",
+                _label_embeddings,
+                kwargs={"target": target},
+                deps={"embeddings": "embeddings", "dataset": "dataset"},
+            ),
+            _plot_stage(
+                f"{target}/plot_dimensionality_reduction",
+                "plot_dimensionality_reduction",
+                {"embeddings": f"{target}/embeddings"},
+                **plot_kwargs,
+                df=None,
+                tag_vals=tag_vals,
+                sampling_type="no",
+                results_path=target_path,
+                tagname=target,
+            ),
+        ]
+        target_store = None
+        if store_kwargs is not None:
+            target_store = {**store_kwargs, "target": target}
+            stages.append(
+                _store_stage(
+                    "embeddings", f"{target}/embeddings", target_store, sampling="no"
+                )
+            )
+        for sampling_method in sampling_methods:
+            prefix = f"{target}/{sampling_method}"
+            stages.append(
+                Stage(
+                    f"{prefix}/preprocess",
+                    _target_dataset,
+                    kwargs={
+                        "targets": targets,
+                        "target": target,
+                        "sampling_method": sampling_method,
+                        "random_state": random_state,
+                    },
+                    deps={"dataset": "dataset"},
+                )
+            )
+            stages += model_stages(
+                lambda stage, prefix=prefix: f"{prefix}/{stage}",
+                f"{prefix}/preprocess",
+                cache,
+                stage_key(data_key, target, sampling_method, random_state),
+                tagname=target,
+                sampling_method=sampling_method,
+                results_path=target_path,
+                classifiers=classifiers,
+                n_jobs=n_jobs,
+                search=search,
+                pycaret_options=pycaret_options,
+                stability_options=stability_options,
+                fold_options=fold_options,
+                voters=voters,
+                plot_kwargs=plot_kwargs,
+                store_kwargs=target_store,
+            )
+    return stages
+
+
+def _best_prefix(cross_val_data, score_name):
+    """(number of features, mean score) of the best or recommended prefix"""
+    means = [np.mean(folds) for folds in cross_val_data["scores"][score_name]]
+    sizes = cross_val_data.get("n_features", range(1, len(means) + 1))
+    recommended = cross_val_data.get("recommended")
+    if recommended is not None and recommended["metric"] == score_name:
+        best = list(sizes).index(recommended["n_features"])
+    else:
+        best = int(np.argmax(means))
+    return sizes[best], means[best]
+
+
+def results_index(results, targets, sampling_methods, classifiers, n_top=5):
+    """
+    One row per (target, sampling method, classifier) of the batch results:
+    dataset size, positive share, top Borda features, best PyCaret model and
+    the best prefix of each cross validation score
+    """
+    rows = []
+    for target in targets:
+        for sampling_method in sampling_methods:
+            prefix = f"{target}/{sampling_method}"
+            df = results[f"{prefix}/preprocess"]
+            bordas = results[f"{prefix}/borda_importance"]
+            leaderboard = results[f"{prefix}/pycaret"]
+            for classifier_name in classifiers:
+                cross_val_data = results[f"{prefix}/cross_val_exp/{classifier_name}"]
+                row = {
+                    "target": target,
+                    "sampling": sampling_method,
+                    "classifier": classifier_name,
+                    "rows": len(df),
+                    "positive_share": float(df[target].mean()),
+                    "top_features": ";".join(bordas["feature_list"][:n_top]),
+                    "pycaret_best": leaderboard["Model"].iloc[0],
+                }
+                for score_name in cross_val_data["scores"]:
+                    n_features, mean = _best_prefix(cross_val_data, score_name)
+                    row[f"{score_name} n_features"] = n_features
+                    row[f"{score_name} mean"] = float(mean)
+                rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def batch(
+    *,
+    csvfile,
+    targets,
+    tag_vals,
+    results_path,
+    int_columns,
+    classifiers,
+    sampling_methods=("no",),
+    n_jobs=1,
+    search="full",
+    cache_dir=None,
+    ingest_dir=None,
+    max_workers=None,
+    dpi=600,
+    fmt="png",
+    background_render=False,
+    pycaret_options=None,
+    stability_options=None,
+    fold_options=None,
+    voters=("native",),
+    random_state=42,
+    store_dir=None,
+    run_id=None,
+    callbacks=(),
+    profile_dir=None,
+    n_threads=None,
+):
+    """
+    csvfile: csv file containing the cohort and every target column
+    targets: target columns, each one analysed as the tag of workflow
+    int_columns: integer columns, including the targets without missing values
+    sampling_methods: sampling methods run for every target
+    max_workers: concurrent stages (all cores when None)
+    n_threads: thread budget shared by all the stages (all cores when None)
+    Other arguments as in workflow.
+    Writes results_index.csv and manifest.json to results_path and returns
+    the results index.
+    """
+    stage_kwargs = dict(
+        csvfile=csvfile,
+        targets=list(targets),
+        tag_vals=tag_vals,
+        results_path=results_path,
+        int_columns=int_columns,
+        classifiers=classifiers,
+        sampling_methods=list(sampling_methods),
+        n_jobs=n_jobs,
+        search=search,
+        cache_dir=cache_dir,
+        ingest_dir=ingest_dir,
+        dpi=dpi,
+        fmt=fmt,
+        pycaret_options=pycaret_options,
+        stability_options=stability_options,
+        fold_options=fold_options,
+        voters=list(voters),
+        random_state=random_state,
+        store_dir=store_dir,
+        run_id=run_id,
+    )
+    if store_dir is not None:
+        stage_kwargs["run_id"] = run_id = run_id or new_run_id()
+        store_run(store_dir, run_id, **stage_kwargs)
+    run_kwargs = dict(callbacks=callbacks, profile_dir=profile_dir, n_threads=n_threads)
+    if max_workers != 1 or not background_render:
+        stages = batch_stages(**stage_kwargs)
+        results, timeline = run_stages(stages, max_workers, **run_kwargs)
+    else:
+        with RenderQueue(dpi, fmt) as render_queue:
+            stages = batch_stages(render_queue=render_queue, **stage_kwargs)
+            results, timeline = run_stages(stages, max_workers=1, **run_kwargs)
+
+    os.makedirs(results_path, exist_ok=True)
+    index = results_index(results, targets, sampling_methods, classifiers)
+    index.to_csv(os.path.join(results_path, INDEX_FILE), index=False)
+    write_manifest(
+        os.path.join(results_path, "manifest.json"),
+        timeline,
+        max_workers=max_workers,
+        **stage_kwargs,
+    )
+    return index
@@ -1,21 +1,20 @@
+import numpy as np
 import pandas as pd
+from scipy.stats import rankdata
 
 
 # Function to assign a rank to each element in a list with the first element being the most important.
 def rank_list(lst: list) -> dict:
-    # Returns a dictionary comprehension where each list element is a key and its rank is a value.
-    # The rank is calculated as the length of the list minus one minus the element's index.
-    return {elm: len(lst) - 1 - i for i, elm in enumerate(lst)}
+    # The rank is the Borda points of the element, the length of the list minus one minus its index.
+    features, positions = encode_rankings([lst])
+    return dict(zip(features, rank_points(positions)[0].tolist()))
 
 
 # Function to perform Borda count aggregation for a list of ranked lists.
 def borda_aggregation(loflists: list[list]) -> dict:
-    # Convert each individual list into a dictionary of ranks.
-    list_ranks = [rank_list(l) for l in loflists]
-    # Create a set of all unique elements across all the lists.
-    feature_set = {i for i in [el for nl in loflists for el in nl]}
-    # Return a dictionary where each element's score is the sum of its ranks across all the lists.
-    return {e: sum([lr.get(e, 0) for lr in list_ranks]) for e in feature_set}
+    # Each element's score is the sum of its ranks across all the lists (0 where a list lacks it).
+    features, positions = encode_rankings(loflists)
+    return dict(zip(features, borda_scores(rank_points(positions)).tolist()))
 
 
 # Function to create a sorted DataFrame from a dictionary of results.
@@ -30,12 +29,62 @@ def create_sorted_df(result: dict):
     return df_sorted
 
 
+# Function to integer-code a list of ranked lists into a (rankers x features) position matrix.
+def encode_rankings(loflists: list[list]) -> tuple[list, np.ndarray]:
+    # Features are coded in order of their first appearance across the lists.
+    features = list(dict.fromkeys(el for nl in loflists for el in nl))
+    codes = {f: i for i, f in enumerate(features)}
+    # Position of each feature in each list, -1 where a (partial) list lacks it.
+    positions = np.full((len(loflists), len(features)), -1, dtype=np.int64)
+    for r, lst in enumerate(loflists):
+        positions[r, [codes[el] for el in lst]] = np.arange(len(lst))
+    return features, positions
+
+
+# Function to turn a position matrix into Borda points, L - 1 - position in a list of length L.
+def rank_points(positions: np.ndarray) -> np.ndarray:
+    # The first of a list of length L gets L - 1 points, missing features get 0.
+    lengths = (positions >= 0).sum(axis=1, keepdims=True)
+    return np.where(positions >= 0, lengths - 1 - positions, 0)
+
+
+# Function to turn a (rankers x features) importance matrix into tie-aware Borda points.
+def importance_points(importances) -> np.ndarray:
+    # NaN marks a feature the ranker did not score (partial list), it gets 0 points.
+    importances = np.asarray(importances, dtype=float)
+    scored = ~np.isnan(importances)
+    # Unscored features rank lowest, equal importances share their average rank.
+    ranks = rankdata(np.where(scored, importances, -np.inf), method="average", axis=1)
+    n_unscored = (~scored).sum(axis=1, keepdims=True)
+    return np.where(scored, ranks - 1 - n_unscored, 0.0)
+
+
+# Function to sum the Borda points of every feature over the rankers, optionally weighted.
+def borda_scores(points: np.ndarray, weights=None) -> np.ndarray:
+    if weights is None:
+        return points.sum(axis=0)
+    return np.asarray(weights, dtype=float) @ points
+
+
 # Function to create a DataFrame from a list of lists using Borda count aggregation.
-def borda_df(loflists: list[list]) -> pd.DataFrame:
-    # Aggregate the lists into a Borda count dictionary.
-    borda_dict = borda_aggregation(loflists)
-    # Create and return a sorted DataFrame from the Borda count dictionary.
-    return create_sorted_df(borda_dict)
+def borda_df(loflists: list[list], weights=None) -> pd.DataFrame:
+    # Integer-code the lists and aggregate their points (one weight per list).
+    features, positions = encode_rankings(loflists)
+    scores = borda_scores(rank_points(positions), weights)
+    # Create and return a sorted DataFrame from the Borda counts.
+    return create_sorted_df(dict(zip(features, scores.tolist())))
+
+
+# Function to create the Borda DataFrame straight from feature importances.
+def borda_df_from_importances(
+    importances, feature_names: list, weights=None
+) -> pd.DataFrame:
+    # importances: (rankers x features), e.g. stacked model.feature_importances_
+    scores = borda_scores(importance_points(importances), weights)
+    # Keep integer counts when there were no ties and no fractional weights.
+    if np.array_equal(scores, np.round(scores)):
+        scores = scores.astype(np.int64)
+    return create_sorted_df(dict(zip(feature_names, scores.tolist())))
 
 
 # Function to create a DataFrame showing the importance of features from a model.
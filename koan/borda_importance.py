@@ -1,48 +1,149 @@
-from catboost import CatBoostClassifier
-from xgboost import XGBClassifier
-from lightgbm import LGBMClassifier
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from . import borda_functions as bdf
-from .plotting import plot_borda_importance
+from . import threads
+from .dataset import from_frame
+from .folds import fold_plan
+from .voters import voter_importances
 
 
-def borda_importance(df, tagname, sampling_method, results_path):
-    tag = df[[tagname]]
-    df = df.drop(columns=[tagname])
+class Bordas(dict):
+    """
+    The bordas dict, still answering the "df" (feature frame) and "tag"
+    (label frame) keys it had before the Dataset replaced them, with a
+    DeprecationWarning; both are rebuilt from "data" in the original row
+    order, with a fresh index
+    """
 
-    xgb = XGBClassifier(
-        eval_metric="logloss",
-        verbosity=0,
-        importance_type="gain",
-        use_label_encoder=False,
-        objective="binary:logistic",
-    )
-    cbc = CatBoostClassifier(iterations=100, verbose=0)
-    lgbm = LGBMClassifier(importance_type="split", objective="binary")
+    def __missing__(self, key):
+        if key not in ("df", "tag"):
+            raise KeyError(key)
+        warnings.warn(
+            f'bordas["{key}"] is deprecated, use bordas["data"] (koan.dataset)',
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        data, plan = self["data"], self.get("folds")
+        if plan is not None:
+            data = data.arrange(np.argsort(plan.order))
+        df = data.to_frame()
+        return df[[data.tagname]] if key == "tag" else df.drop(columns=data.tagname)
 
-    xgb.fit(df, tag[tagname])
-    cbc.fit(df, tag[tagname])
-    lgbm.fit(df, tag[tagname])
 
-    xgb_importance = bdf.feature_importance_df_creation(
-        xgb, "XgBoost_importance", list(df.columns)
-    )
-    cbc_importance = bdf.feature_importance_df_creation(
-        cbc, "CatBoost_importance", list(df.columns)
-    )
-    lgbm_importance = bdf.feature_importance_df_creation(
-        lgbm, "LightGBM_importance", list(df.columns)
-    )
+def _timed_fit(model, X, y):
+    start = time.perf_counter()
+    model.fit(X, y)
+    return time.perf_counter() - start
 
-    xgboost_imp_lst = list(xgb_importance["feature_name"])
-    catboost_imp_lst = list(cbc_importance["feature_name"])
-    lgbm_imp_lst = list(lgbm_importance["feature_name"])
 
-    borda_results = bdf.borda_df([xgboost_imp_lst, catboost_imp_lst, lgbm_imp_lst])
-    # borda_results, sampling_type, results_path
-    plot_borda_importance(borda_results, sampling_method, results_path)
+def make_boosters(n_threads, random_state=None):
+    """The three voting boosters, sharing n_threads threads"""
+    # The boosters are imported when the stage runs, not with koan
+    from catboost import CatBoostClassifier
+    from xgboost import XGBClassifier
+    from lightgbm import LGBMClassifier
+
+    xgb_threads, cbc_threads, lgbm_threads = threads.split(n_threads, 3)
     return {
-        "borda_importance": borda_results,
-        "tag": tag,
-        "df": df,
-        "feature_list": list(borda_results["Feature"]),
+        "XgBoost": XGBClassifier(
+            eval_metric="logloss",
+            verbosity=0,
+            importance_type="gain",
+            use_label_encoder=False,
+            objective="binary:logistic",
+            n_jobs=xgb_threads,
+            random_state=random_state,
+        ),
+        "CatBoost": CatBoostClassifier(
+            iterations=100,
+            verbose=0,
+            thread_count=cbc_threads,
+            random_seed=random_state,
+        ),
+        "LightGBM": LGBMClassifier(
+            importance_type="split",
+            objective="binary",
+            n_jobs=lgbm_threads,
+            random_state=random_state,
+        ),
     }
+
+
+def fit_boosters(X, y, n_jobs=None, random_state=None):
+    """
+    Fit the boosters of make_boosters concurrently
+    n_jobs: total threads of the fits (the thread budget when None)
+    Returns ({name: fitted booster}, {name: fit wall time in seconds})
+    """
+    models = make_boosters(n_jobs or threads.available(), random_state)
+    # The boosters release the GIL while training, so threads are enough
+    with ThreadPoolExecutor(max_workers=len(models)) as executor:
+        futures = {
+            name: executor.submit(_timed_fit, model, X, y)
+            for name, model in models.items()
+        }
+        fit_times = {name: future.result() for name, future in futures.items()}
+    return models, fit_times
+
+
+def borda_importance_scores(
+    df, tagname, n_jobs=None, stability=None, voters=("native",), folds=None
+):
+    """
+    n_jobs: total threads shared by the three boosters, which are fitted
+            concurrently (the thread budget when None)
+    voters: importances each booster votes with, among "native"
+            (feature_importances_), "shap" and "permutation" (koan.voters)
+    stability: stability_selection options, e.g. {"n_draws": 100}; its
+               table is then added to the result under "stability"
+    folds: koan.folds.fold_plan options of the cross validations, e.g.
+           {"n_splits": 5, "random_state": 1} (seeded, stratified, 10 folds
+           when None)
+    Returns the bordas dict: "borda_importance" (Borda table), "data" (the
+    Dataset of df with its columns in Borda order, so that the prefixes are
+    views, and its rows arranged by fold), "folds" (the FoldPlan every
+    classifier is cross validated on), "feature_list" and the wall time of
+    each booster fit in seconds under "fit_times". The former "df" and "tag"
+    frames are still served, deprecated, by Bordas.
+    """
+    features = [column for column in df.columns if column != tagname]
+    # Convert once, the three boosters all take the same float32 array
+    # (C ordered, LightGBM would copy a Fortran ordered one)
+    X = df[features].to_numpy(dtype=np.float32)
+    y = df[tagname].to_numpy()
+    models, fit_times = fit_boosters(X, y, n_jobs)
+
+    # One Borda list per booster and voter, equal importances within a list
+    # share their points
+    importances, _ = voter_importances(models, X, y, voters, n_jobs=n_jobs)
+    borda_results = bdf.borda_df_from_importances(importances, features)
+    feature_list = list(borda_results["Feature"])
+    del X
+    plan = fold_plan(y, **(folds or {}))
+    bordas = Bordas(
+        {
+            "borda_importance": borda_results,
+            "data": from_frame(df, tagname, feature_list, plan.order),
+            "folds": plan,
+            "feature_list": feature_list,
+            "fit_times": fit_times,
+        }
+    )
+    if stability is not None:
+        from .stability import stability_selection
+
+        bordas["stability"] = stability_selection(
+            df, tagname, **{"voters": voters, **stability}
+        )
+    return bordas
+
+
+def borda_importance(df, tagname, sampling_method, results_path, n_jobs=None):
+    from .plotting import plot_borda_importance
+
+    bordas = borda_importance_scores(df, tagname, n_jobs)
+    # borda_results, sampling_type, results_path
+    plot_borda_importance(bordas["borda_importance"], sampling_method, results_path)
+    return bordas
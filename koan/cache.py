@@ -0,0 +1,89 @@
+"""
+On disk cache of pipeline stage results
+
+Results are pickled under a key hashed from everything the stage depends on
+(input file contents, parameters, seeds), so an unchanged stage is loaded
+instead of recomputed. The cache is bounded in size, the least recently
+used entries are evicted first.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+def file_digest(path, chunk_size=1024**2):
+    """sha256 of the contents of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stage_key(*parts):
+    """
+    Hash of the parts a stage result depends on. Parts that are not json
+    serialisable (estimators, paths) are hashed through their repr.
+    """
+    blob = json.dumps(parts, sort_keys=True, default=repr)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class StageCache:
+    """
+    root: directory holding the cached results
+    max_bytes: total size above which least recently used entries are evicted
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, stage, key):
+        return os.path.join(self.root, f"{stage}-{key}.pkl")
+
+    def get_or_compute(self, stage, key, compute):
+        """Load the result of stage for key, or compute() and store it"""
+        path = self._path(stage, key)
+        if os.path.exists(path):
+            # Refresh the modification time, it is the LRU order
+            os.utime(path)
+            with open(path, "rb") as fh:
+                return pickle.load(fh)
+
+        result = compute()
+        # Write to a temporary file first so readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            pickle.dump(result, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict()
+        return result
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes"""
+        entries = [
+            entry
+            for entry in os.scandir(self.root)
+            if entry.is_file() and entry.name.endswith(".pkl")
+        ]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            total -= entry.stat().st_size
+            os.remove(entry.path)
+
+
+def cached(cache, stage, key, compute):
+    """cache.get_or_compute, or just compute() when cache is None"""
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(stage, key, compute)
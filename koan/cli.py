@@ -0,0 +1,250 @@
+"""
+Command line interface
+
+    python -m koan data.csv --tagname anyadr --int-columns SEX AGE --results results
+    python -m koan --config experiment.json --max-workers 6
+    python -m koan cohort.csv --targets adr1 adr2 adr3 --max-workers 6
+    python -m koan cohort.csv --tagname anyadr --refresh state
+
+The options can be given in a json config file, whose keys are the long
+option names with underscores (see experiment.json); command line options
+override the config.
+"""
+
+import json
+import argparse
+
+DEFAULTS = {
+    "tagname": "anyadr",
+    "tag_vals": {0.0: "No", 1.0: "Yes"},
+    "sampling": ["no", "undersampling", "smote"],
+    "int_columns": [],
+    "results": "results",
+    "classifiers": ["LDA", "KNN", "LRC"],
+    "n_neighbors": 10,
+    "max_workers": 1,
+    "n_jobs": 1,
+    "search": "full",
+    "voters": ["native"],
+    "random_state": 42,
+    "dpi": 600,
+    "fmt": "png",
+}
+
+
+def _classifiers(names, n_neighbors):
+    # Imported here, so that --help does not load sklearn
+    from sklearn.linear_model import LogisticRegression
+    from .prefix_scan import KNNPrefixScan, LDAPrefixScan, LogisticPrefixScan
+
+    factories = {
+        "LDA": LDAPrefixScan,
+        "KNN": lambda: KNNPrefixScan(n_neighbors=n_neighbors),
+        "LRC": lambda: LogisticPrefixScan(LogisticRegression()),
+    }
+    unknown = set(names) - factories.keys()
+    if unknown:
+        raise ValueError(f"Not existing classifiers: {unknown}")
+    return {name: factories[name]() for name in names}
+
+
+def _stability_options(options):
+    """stability_options of the config, with n_draws from --stability-draws"""
+    stability = options.get("stability_options")
+    if options.get("stability_draws"):
+        stability = {**(stability or {}), "n_draws": options["stability_draws"]}
+    return stability
+
+
+def parser():
+    parser = argparse.ArgumentParser(
+        prog="koan", description="Analysis of tabular data"
+    )
+    parser.add_argument("csvfile", nargs="?", help="csv file containing the dataset")
+    parser.add_argument("--config", help="json file of options")
+    parser.add_argument("--tagname", help="target column")
+    parser.add_argument(
+        "--targets", nargs="+", help="several target columns, run in batch mode"
+    )
+    parser.add_argument(
+        "--sampling", nargs="+", choices=["no", "undersampling", "smote"]
+    )
+    parser.add_argument("--int-columns", nargs="*", help="integer columns")
+    parser.add_argument("--results", help="root directory of the results")
+    parser.add_argument("--classifiers", nargs="+", help="LDA, KNN and / or LRC")
+    parser.add_argument("--n-neighbors", type=int, help="neighbours of KNN")
+    parser.add_argument("--max-workers", type=int, help="concurrent stages")
+    parser.add_argument("--n-jobs", type=int, help="cross validation workers")
+    parser.add_argument(
+        "--threads", type=int, help="thread budget of the run (all cores)"
+    )
+    parser.add_argument("--search", choices=["full", "adaptive"])
+    parser.add_argument(
+        "--voters",
+        nargs="+",
+        choices=["native", "shap", "permutation"],
+        help="importances voting in the Borda consensus",
+    )
+    parser.add_argument(
+        "--stability-draws", type=int, help="bootstrap draws of the Borda ranking"
+    )
+    parser.add_argument("--random-state", type=int, help="seed of the resampling")
+    parser.add_argument("--cache-dir", help="stage cache directory")
+    parser.add_argument("--ingest-dir", help="columnar csv cache directory")
+    parser.add_argument("--profile-dir", help="cProfile dumps of the stages")
+    parser.add_argument(
+        "--store", help="results store directory, for python -m koan.replot"
+    )
+    parser.add_argument("--run-id", help="run id in the store (start time)")
+    parser.add_argument(
+        "--refresh",
+        metavar="STATE_DIR",
+        help="update the Borda ranking and cross validation of the last "
+        "--refresh run with the rows appended to csvfile since (koan.incremental)",
+    )
+    parser.add_argument("--dpi", type=int)
+    parser.add_argument("--fmt", help="figure format (png, svg, pdf...)")
+    return parser
+
+
+def load_options(argv=None):
+    """Defaults, updated by the config file, updated by the command line"""
+    args = vars(parser().parse_args(argv))
+    options = dict(DEFAULTS)
+    config = args.pop("config")
+    if config is not None:
+        with open(config) as fh:
+            options.update(json.load(fh))
+    options.update({k: v for k, v in args.items() if v is not None})
+    if options.get("csvfile") is None:
+        raise SystemExit("koan: a csvfile is required (argument or config)")
+    # json keys are strings, the tag values are numbers
+    options["tag_vals"] = {float(k): v for k, v in options["tag_vals"].items()}
+    return options
+
+
+def _refresh(options, classifiers):
+    """Incremental refresh of the --refresh state, prints its diff report"""
+    from .incremental import refresh
+
+    report = refresh(
+        options["csvfile"],
+        options["refresh"],
+        tagname=options["tagname"],
+        int_columns=options["int_columns"],
+        classifiers=classifiers,
+        nsplit=(options.get("fold_options") or {}).get("n_splits", 10),
+        n_jobs=options["n_jobs"],
+    )
+    print(f"{report['mode']}: {report['new_rows']} new rows")
+    ranking = report["ranking"]
+    moved = ranking[ranking["change"] != 0]
+    if len(moved):
+        print(moved.to_string(index=False))
+    for name, scores in report["scores"].items():
+        print(name)
+        print(scores.to_string(index=False))
+    return 0
+
+
+def main(argv=None):
+    options = load_options(argv)
+    classifiers = _classifiers(options["classifiers"], options["n_neighbors"])
+    if options.get("refresh"):
+        return _refresh(options, classifiers)
+    if options.get("targets"):
+        from .batch import batch
+
+        index = batch(
+            csvfile=options["csvfile"],
+            targets=options["targets"],
+            tag_vals=options["tag_vals"],
+            results_path=options["results"],
+            int_columns=options["int_columns"],
+            classifiers=classifiers,
+            sampling_methods=options["sampling"],
+            n_jobs=options["n_jobs"],
+            search=options["search"],
+            cache_dir=options.get("cache_dir"),
+            ingest_dir=options.get("ingest_dir"),
+            max_workers=options["max_workers"],
+            dpi=options["dpi"],
+            fmt=options["fmt"],
+            background_render=True,
+            pycaret_options=options.get("pycaret_options"),
+            stability_options=_stability_options(options),
+            fold_options=options.get("fold_options"),
+            voters=options["voters"],
+            random_state=options["random_state"],
+            store_dir=options.get("store"),
+            run_id=options.get("run_id"),
+            profile_dir=options.get("profile_dir"),
+            n_threads=options.get("threads"),
+        )
+        print(index.to_string(index=False))
+        return 0
+
+    from .instrument import write_manifest
+    from .scheduler import run_stages
+    from .store import new_run_id, store_run
+    from .utilities import create_save_path
+    from .workflows import workflow_stages
+
+    if options.get("store"):
+        options["run_id"] = options.get("run_id") or new_run_id()
+        store_run(options["store"], options["run_id"], **options)
+    # The stages of all sampling methods go into one graph, so independent
+    # ones (embeddings, heatmaps, PyCaret, Borda/CV chains) overlap
+    stages = [
+        stage
+        for sampling_method in options["sampling"]
+        for stage in workflow_stages(
+            csvfile=options["csvfile"],
+            tagname=options["tagname"],
+            sampling_method=sampling_method,
+            tag_vals=options["tag_vals"],
+            results_path=options["results"],
+            int_columns=options["int_columns"],
+            classifiers=classifiers,
+            n_jobs=options["n_jobs"],
+            search=options["search"],
+            cache_dir=options.get("cache_dir"),
+            ingest_dir=options.get("ingest_dir"),
+            dpi=options["dpi"],
+            fmt=options["fmt"],
+            pycaret_options=options.get("pycaret_options"),
+            stability_options=_stability_options(options),
+            fold_options=options.get("fold_options"),
+            voters=options["voters"],
+            random_state=options["random_state"],
+            store_dir=options.get("store"),
+            run_id=options.get("run_id"),
+        )
+    ]
+    results, timeline = run_stages(
+        stages,
+        options["max_workers"],
+        profile_dir=options.get("profile_dir"),
+        n_threads=options.get("threads"),
+    )
+    write_manifest(
+        create_save_path("all", "manifest.json", options["results"]),
+        timeline,
+        **options,
+    )
+    for entry in sorted(timeline, key=lambda entry: entry["start"]):
+        print(
+            f"{entry['start']:8.1f}s {entry['end']:8.1f}s "
+            f"{entry['duration']:8.1f}s  {entry['stage']}"
+        )
+    # Number of features recommended by the adaptive search
+    for stage, result in results.items():
+        if isinstance(result, dict) and "recommended" in result:
+            recommended = result["recommended"]
+            low, high = recommended["ci"]
+            print(
+                f"{stage}: {recommended['n_features']} features recommended, "
+                f"{recommended['metric']} {recommended['mean']:.3f} "
+                f"[{low:.3f}, {high:.3f}]"
+            )
+    return 0
@@ -0,0 +1,79 @@
+"""
+Correlation matrices of wide datasets
+
+The columns are standardised once in float32 and the matrix is built from
+blocked matrix products, Spearman correlations being Pearson correlations
+of the column ranks. Wide matrices can be reduced to their most correlated
+pairs or to a hierarchically clustered submatrix for plotting.
+Missing values are not supported (unlike DataFrame.corr).
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import leaves_list, linkage
+from scipy.spatial.distance import squareform
+from scipy.stats import rankdata
+
+
+def correlation_matrix(df, method="pearson", block_size=1024):
+    """
+    df: numerical DataFrame
+    method: "pearson" or "spearman"
+    block_size: columns per block of the blocked products
+    Returns the float32 correlation matrix as a DataFrame, NaN for constant columns
+    """
+    if method not in ("pearson", "spearman"):
+        raise ValueError(f"Not existing method: {method}")
+    # A copy, it is standardised in place (to_numpy can return a read-only
+    # view of a float32 frame)
+    X = np.array(df, dtype=np.float32, copy=True)
+    if method == "spearman":
+        X = rankdata(X, axis=0).astype(np.float32)
+    # Z.T @ Z of the standardised columns is the correlation matrix
+    X -= X.mean(axis=0)
+    norms = np.linalg.norm(X, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        X /= norms
+
+    n_columns = X.shape[1]
+    corr = np.empty((n_columns, n_columns), dtype=np.float32)
+    for i in range(0, n_columns, block_size):
+        for j in range(i, n_columns, block_size):
+            block = X[:, i : i + block_size].T @ X[:, j : j + block_size]
+            corr[i : i + block_size, j : j + block_size] = block
+            corr[j : j + block_size, i : i + block_size] = block.T
+    np.clip(corr, -1, 1, out=corr)
+    return pd.DataFrame(corr, index=df.columns, columns=df.columns)
+
+
+def top_pairs(corr_matrix, n_pairs=50):
+    """The n_pairs feature pairs with the largest |r|, strongest first"""
+    corr = corr_matrix.to_numpy()
+    rows, cols = np.triu_indices(len(corr), k=1)
+    values = np.nan_to_num(corr[rows, cols])
+    n_pairs = min(n_pairs, len(values))
+    top = np.argpartition(-np.abs(values), n_pairs - 1)[:n_pairs]
+    top = top[np.argsort(-np.abs(values[top]))]
+    return pd.DataFrame(
+        {
+            "Feature 1": corr_matrix.columns[rows[top]],
+            "Feature 2": corr_matrix.columns[cols[top]],
+            "r": values[top],
+        }
+    )
+
+
+def clustered_submatrix(corr_matrix, max_features=60):
+    """
+    The max_features features most correlated with another one, reordered by
+    average linkage clustering on 1 - |r| so that correlated groups are adjacent
+    """
+    corr = np.abs(np.nan_to_num(corr_matrix.to_numpy(dtype=np.float64)))
+    np.fill_diagonal(corr, 0)
+    keep = np.sort(np.argsort(-corr.max(axis=0))[:max_features])
+    if len(keep) < 3:
+        return corr_matrix.iloc[keep, keep]
+    distance = 1 - corr[np.ix_(keep, keep)]
+    np.fill_diagonal(distance, 0)
+    order = keep[leaves_list(linkage(squareform(distance), method="average"))]
+    return corr_matrix.iloc[order, order]
@@ -1,34 +1,207 @@
 """Cross Validation Experiments"""
 
-from sklearn.model_selection import KFold, cross_validate
+import warnings
+import numpy as np
+from scipy import stats
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score, f1_score, get_scorer, roc_auc_score
+from . import threads
+from .folds import fold_plan, split_block
+from .prefix_scan import PrefixScan
 
+# Score name (as shown on the boxplots) -> sklearn scorer name
+SCORING = {"Accuracy": "accuracy", "F1-score": "f1", "ROC-AUC": "roc_auc"}
 
-def cross_val_exp(bordas, classifier_name, classifier, nsplit=10, tag_name="anyadr"):
+
+def _fit_and_score(classifier, X, y, k, block):
+    """Fit a fresh clone on one (prefix, fold) cell and score it on the test block"""
+    X_train, y_train, X_test, y_test = split_block(X, y, block, k)
+    estimator = clone(classifier).fit(X_train, y_train)
+    return [
+        get_scorer(scorer)(estimator, X_test, y_test) for scorer in SCORING.values()
+    ]
+
+
+def _scan_and_score(scanner, X, y, block, sizes):
+    """Run a prefix scan classifier over one fold and score the given prefix sizes"""
+    X_train, y_train, X_test, y_test = split_block(X, y, block, max(sizes))
+    scores = []
+    for k, (y_pred, proba) in enumerate(scanner.scan(X_train, y_train, X_test), 1):
+        if k in sizes:
+            scores.append(
+                [
+                    accuracy_score(y_test, y_pred),
+                    f1_score(y_test, y_pred),
+                    roc_auc_score(y_test, proba[:, 1]),
+                ]
+            )
+        if k == max(sizes):
+            break
+    return scores
+
+
+def _evaluate_prefixes(parallel, classifier, X, y, folds, sizes):
     """
-    Cross Validation Experiment
-    bordas: {"borda_importance": borda_results, "tag": tag, "df": df}
-    """
-    kf = KFold(n_splits=nsplit, shuffle=True)
-    accuracies = []
-    f1s = []
-    roc_aucs = []
-    # Loop over the feature list and run cross-validation
-    for i in range(len(bordas["feature_list"])):
-        selected_features = bordas["feature_list"][: i + 1]
-        selected_df = bordas["df"][selected_features]
-        class_scores = cross_validate(
-            classifier,
-            selected_df,
-            bordas["tag"][tag_name],
-            scoring=("accuracy", "f1", "roc_auc"),
-            cv=kf,
+    cells[prefix, fold, score] for the given (increasing) prefix sizes,
+    the columns of X being in Borda order and its rows arranged by fold
+    folds: (start, stop) test block of each fold
+    """
+    # Every worker gets its share of the thread budget for BLAS / OpenMP
+    with threads.budget(threads.share(effective_n_jobs(parallel.n_jobs))):
+        if isinstance(classifier, PrefixScan):
+            cells = parallel(
+                delayed(_scan_and_score)(classifier, X, y, block, sizes)
+                for block in folds
+            )
+            return np.asarray(cells).transpose(1, 0, 2)
+        cells = parallel(
+            delayed(_fit_and_score)(classifier, X, y, k, block)
+            for k in sizes
+            for block in folds
         )
+    return np.asarray(cells).reshape(len(sizes), len(folds), len(SCORING))
+
+
+def _prepare(bordas, nsplit=None):
+    """
+    Borda ordered feature matrix and labels, rows arranged by fold, and the
+    test block of each fold
+    """
+    data, plan = bordas["data"], bordas.get("folds")
+    if plan is None or nsplit not in (None, plan.n_splits):
+        # No shared plan with these folds, arrange a copy of the rows
+        plan = fold_plan(data.y, nsplit or 10)
+        data = data.arrange(plan.order)
+    return data.X, data.y, plan.blocks()
+
+
+def _deprecated_tag_name(tag_name):
+    if tag_name is not None:
+        warnings.warn(
+            "tag_name is deprecated and ignored, the labels are part of "
+            'bordas["data"]',
+            DeprecationWarning,
+            stacklevel=3,
+        )
+
 
-        accuracies.append(class_scores["test_accuracy"])
-        f1s.append(class_scores["test_f1"])
-        roc_aucs.append(class_scores["test_roc_auc"])
+def _scores(cells):
+    """cells[prefix, fold, score] -> one array of fold scores per prefix and score"""
+    return {
+        score_name: [cells[i, :, j] for i in range(len(cells))]
+        for j, score_name in enumerate(SCORING)
+    }
+
+
+def cross_val_exp(
+    bordas,
+    classifier_name,
+    classifier,
+    nsplit=None,
+    tag_name=None,
+    n_jobs=1,
+    backend="loky",
+):
+    """
+    Cross Validation Experiment
+    bordas: borda_importance_scores result, the Borda ordered Dataset
+            under "data" is what is cross validated
+    nsplit: number of folds, those of the fold plan of bordas (koan.folds,
+            shared by every classifier) when None, 10 without a plan
+    tag_name: deprecated and ignored, the labels are part of bordas["data"]
+    n_jobs: number of workers the (prefix x fold) grid is spread over
+    backend: joblib backend, "loky" (processes) or "threading"
+    classifier: sklearn estimator, or a PrefixScan that fits all the prefixes
+                of a fold in one pass (one task per fold instead of per cell)
+
+    The feature matrix is handed to the workers once as a numpy array; with the
+    process backend joblib memory-maps it instead of pickling it per task.
+    Its columns are in Borda order, so a prefix is a slice of it.
+    """
+    _deprecated_tag_name(tag_name)
+    X, y, folds = _prepare(bordas, nsplit)
+    parallel = Parallel(n_jobs=n_jobs, backend=backend, max_nbytes="1M", mmap_mode="r")
+    sizes = list(range(1, X.shape[1] + 1))
+    cells = _evaluate_prefixes(parallel, classifier, X, y, folds, sizes)
+    return {"classifier_name": classifier_name, "scores": _scores(cells)}
+
+
+def adaptive_cross_val_exp(
+    bordas,
+    classifier_name,
+    classifier,
+    nsplit=None,
+    tag_name=None,
+    n_jobs=1,
+    backend="loky",
+    metric="ROC-AUC",
+    confidence=0.95,
+):
+    """
+    Cross Validation Experiment over a subset of the prefix sizes
+    metric: score (key of SCORING) the number of features is chosen on
+    confidence: level of the confidence interval of the recommended prefix
+
+    A geometric grid of prefix sizes is evaluated first, then the gaps next
+    to the best size found so far are bisected until they are closed, so
+    about O(log n_features) prefixes are cross validated. The recommended
+    number of features is the smallest evaluated one whose mean score is
+    within one standard error of the best (one standard error rule).
+    The result has the cross_val_exp layout restricted to the evaluated
+    prefixes, plus their sizes under "n_features" and the "recommended" one.
+    A PrefixScan classifier yields every prefix of a fold from one scan, so
+    the geometric grid would scan up to the largest size anyway: all the
+    prefixes are then scored in that single pass and only the recommendation
+    is adaptive.
+    tag_name: deprecated and ignored, as in cross_val_exp
+    """
+    _deprecated_tag_name(tag_name)
+    X, y, folds = _prepare(bordas, nsplit)
+    parallel = Parallel(n_jobs=n_jobs, backend=backend, max_nbytes="1M", mmap_mode="r")
+    metric_idx = list(SCORING).index(metric)
+    n_features = X.shape[1]
+
+    evaluated = {}
+    if isinstance(classifier, PrefixScan):
+        candidates = list(range(1, n_features + 1))
+    else:
+        grid = np.geomspace(1, n_features, num=int(np.log2(n_features)) + 2)
+        candidates = sorted({int(k) for k in np.rint(grid)})
+    while candidates:
+        cells = _evaluate_prefixes(parallel, classifier, X, y, folds, candidates)
+        evaluated.update(zip(candidates, cells))
+        sizes = sorted(evaluated)
+        means = [evaluated[k][:, metric_idx].mean() for k in sizes]
+        best = int(np.argmax(means))
+        # Bisect the gaps on both sides of the best size
+        candidates = sorted(
+            {
+                (sizes[nb] + sizes[best]) // 2
+                for nb in (best - 1, best + 1)
+                if 0 <= nb < len(sizes) and abs(sizes[nb] - sizes[best]) > 1
+            }
+        )
 
+    sizes = sorted(evaluated)
+    cells = np.asarray([evaluated[k] for k in sizes])
+    folds_metric = cells[:, :, metric_idx]
+    means = folds_metric.mean(axis=1)
+    sems = folds_metric.std(axis=1, ddof=1) / np.sqrt(len(folds))
+    best = int(np.argmax(means))
+    recommended = int(np.argmax(means >= means[best] - sems[best]))
+    half_width = stats.t.ppf((1 + confidence) / 2, len(folds) - 1) * sems[recommended]
     return {
         "classifier_name": classifier_name,
-        "scores": {"Accuracy": accuracies, "F1-score": f1s, "ROC-AUC": roc_aucs},
+        "scores": _scores(cells),
+        "n_features": sizes,
+        "recommended": {
+            "n_features": sizes[recommended],
+            "metric": metric,
+            "mean": float(means[recommended]),
+            "ci": (
+                float(means[recommended] - half_width),
+                float(means[recommended] + half_width),
+            ),
+        },
     }
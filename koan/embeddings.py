@@ -0,0 +1,95 @@
+"""
+Embeddings of the dataset for the dimensionality reduction plots
+
+PCA is fitted once with 3 components, its first 2 components being the 2D
+PCA. t-SNE and UMAP are initialised from those components and run
+in parallel. Datasets above max_rows rows are embedded on a stratified
+subsample.
+"""
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.decomposition import PCA
+from sklearn.utils import resample
+from . import threads
+
+# umap and TSNE are imported in the worker that runs them, umap alone
+# takes seconds to import
+
+
+def _tsne(X, init, random_state):
+    from sklearn.manifold import TSNE
+
+    # Same scale as sklearn's own init="pca"
+    init = init / np.std(init[:, 0]) * 1e-4
+    return TSNE(
+        n_components=init.shape[1],
+        init=init,
+        random_state=random_state,
+        n_jobs=threads.available(),
+    ).fit_transform(X)
+
+
+def _umap(X, init, random_state):
+    import umap
+
+    # Same scale as umap's own spectral / pca inits
+    init = init / np.abs(init).max() * 10
+    threads.numba_threads(threads.available())
+    return umap.UMAP(
+        n_components=init.shape[1], init=init, random_state=random_state
+    ).fit_transform(X)
+
+
+def compute_embeddings(df, tagname, max_rows=5000, random_state=0, n_jobs=None):
+    """
+    df: dataset including the tagname column
+    tagname: None for an unlabelled embedding of all the columns of df,
+             to be shared by several targets
+    max_rows: larger datasets are embedded on a subsample of that size,
+              stratified on the tag when there is one
+    n_jobs: worker processes the embeddings are spread over (as many as the
+            thread budget allows when None), each one with its share of it
+    Returns {"labels": tag of the embedded rows (None if unlabelled),
+             "rows": positions of the embedded rows (None if all of them),
+             plot title: coordinates}
+    """
+    if tagname is None:
+        X, labels = df.to_numpy(dtype=np.float32), None
+    else:
+        X = df.drop(columns=[tagname]).to_numpy(dtype=np.float32)
+        labels = df[tagname].to_numpy()
+    rows = None
+    if len(X) > max_rows:
+        rows = resample(
+            np.arange(len(X)),
+            replace=False,
+            n_samples=max_rows,
+            stratify=labels,
+            random_state=random_state,
+        )
+        X = X[rows]
+        labels = labels[rows] if labels is not None else None
+
+    pca = PCA(n_components=3).fit_transform(X)
+    tasks = {
+        "UMAP 2D": (_umap, pca[:, :2]),
+        "t-SNE 2D": (_tsne, pca[:, :2]),
+        "UMAP 3D": (_umap, pca),
+        "t-SNE 3D": (_tsne, pca),
+    }
+    # Processes rather than threads: numba's default threading layer, used by
+    # UMAP, does not support concurrent parallel calls from several threads
+    n_jobs = n_jobs or min(len(tasks), threads.available())
+    with threads.budget(threads.share(n_jobs)):
+        coords = Parallel(n_jobs=n_jobs)(
+            delayed(func)(X, init, random_state) for func, init in tasks.values()
+        )
+    embeddings = dict(zip(tasks, coords))
+    return {
+        "labels": labels,
+        "rows": rows,
+        "PCA 2D": pca[:, :2],
+        "PCA 3D": pca,
+        **embeddings,
+    }
@@ -0,0 +1,246 @@
+"""
+Incremental refresh of a growing cohort csv
+
+A snapshot of the last run (the parsed rows, the byte size and digest of
+the csv they came from, the fitted boosters, the Borda ranking and the
+cross validation results) is kept in a state directory. When the csv has
+only grown since, the appended rows are parsed alone, the boosters are
+updated by continued training (XGBoost xgb_model, LightGBM and CatBoost
+init_model) and every prefix is cross validated again on folds of the grown
+dataset (scores of old and new folds are not comparable, so none are kept).
+Nothing is recomputed when no row was appended, and any other change of the
+file triggers a full run.
+
+    python -m koan cohort.csv --tagname anyadr --refresh state
+
+"""
+
+import os
+import pickle
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+from . import borda_functions as bdf
+from .borda_importance import fit_boosters, make_boosters
+from .cross_validation import cross_val_exp
+from .dataset import from_frame
+from .folds import fold_plan
+from .ingest import read_csv_tail, read_csv_typed
+from . import threads
+
+SNAPSHOT_FILE = "snapshot.pkl"
+
+
+def _prefix_digest(path, size, chunk_size=1024**2):
+    """sha256 of the first size bytes of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        while size > 0:
+            chunk = fh.read(min(chunk_size, size))
+            if not chunk:
+                break
+            digest.update(chunk)
+            size -= len(chunk)
+    return digest.hexdigest()
+
+
+def continue_boosters(models, X, y, n_rounds=20, n_jobs=None):
+    """
+    Boosters continuing the fitted ones with n_rounds more trees fitted on
+    X, y (all the rows, so that the new trees see the whole cohort)
+    """
+    updated = make_boosters(n_jobs or threads.available())
+    updated["XgBoost"].set_params(n_estimators=n_rounds)
+    updated["CatBoost"].set_params(iterations=n_rounds)
+    updated["LightGBM"].set_params(n_estimators=n_rounds)
+    init = {
+        "XgBoost": {"xgb_model": models["XgBoost"].get_booster()},
+        "CatBoost": {"init_model": models["CatBoost"]},
+        "LightGBM": {"init_model": models["LightGBM"].booster_},
+    }
+    for name, model in updated.items():
+        model.fit(X, y, **init[name])
+    return updated
+
+
+def _ranking(models, features):
+    importances = np.vstack([model.feature_importances_ for model in models.values()])
+    return bdf.borda_df_from_importances(importances, features)
+
+
+def changed_prefixes(old_list, new_list):
+    """Prefix sizes whose feature set differs between two rankings"""
+    old_seen, new_seen, changed = set(), set(), []
+    for k, (old, new) in enumerate(zip(old_list, new_list), 1):
+        old_seen.add(old)
+        new_seen.add(new)
+        if old_seen != new_seen:
+            changed.append(k)
+    return changed
+
+
+def _save(snapshot, state_dir):
+    os.makedirs(state_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=state_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as fh:
+        pickle.dump(snapshot, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, os.path.join(state_dir, SNAPSHOT_FILE))
+
+
+def _load(state_dir):
+    path = os.path.join(state_dir, SNAPSHOT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as fh:
+        return pickle.load(fh)
+
+
+def _cross_validate(df, tagname, feature_list, classifiers, nsplit, n_jobs):
+    """cross_val_exp of every classifier on folds of df shared by all of them"""
+    y = df[tagname].to_numpy()
+    plan = fold_plan(y, nsplit)
+    bordas = {"data": from_frame(df, tagname, feature_list, plan.order), "folds": plan}
+    return {
+        name: cross_val_exp(bordas, name, classifier, n_jobs=n_jobs)
+        for name, classifier in classifiers.items()
+    }
+
+
+def _full_run(df, tagname, classifiers, nsplit, n_jobs):
+    features = [column for column in df.columns if column != tagname]
+    X = df[features].to_numpy(dtype=np.float32)
+    models, _ = fit_boosters(X, df[tagname].to_numpy())
+    del X
+    borda_results = _ranking(models, features)
+    feature_list = list(borda_results["Feature"])
+    cross_val = _cross_validate(df, tagname, feature_list, classifiers, nsplit, n_jobs)
+    return models, borda_results, cross_val
+
+
+def _rank_diff(old_list, new_list):
+    old_rank = {feature: rank for rank, feature in enumerate(old_list, 1)}
+    diff = pd.DataFrame(
+        {"Feature": new_list, "new_rank": np.arange(1, len(new_list) + 1)}
+    )
+    diff["old_rank"] = diff["Feature"].map(old_rank)
+    diff["change"] = diff["old_rank"] - diff["new_rank"]
+    return diff
+
+
+def _score_diff(old, new):
+    """Mean scores of every prefix, before and after"""
+    rows = []
+    for score_name in new["scores"]:
+        for k, (old_folds, new_folds) in enumerate(
+            zip(old["scores"][score_name], new["scores"][score_name]), 1
+        ):
+            rows.append(
+                {
+                    "score": score_name,
+                    "n_features": k,
+                    "old_mean": float(np.mean(old_folds)),
+                    "new_mean": float(np.mean(new_folds)),
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def refresh(
+    csvfile,
+    state_dir,
+    *,
+    tagname,
+    int_columns,
+    classifiers,
+    dtypes=None,
+    nsplit=10,
+    n_rounds=20,
+    n_jobs=1,
+):
+    """
+    Bring the Borda ranking and the cross validation results of csvfile up
+    to date with the snapshot in state_dir, and update the snapshot
+    classifiers: {name: classifier} cross validated on the Borda prefixes
+    nsplit: number of folds
+    n_rounds: trees added to each booster by the continued training
+    n_jobs: workers of the cross validation
+    Returns the diff report: {"mode": "full", "appended" or "unchanged",
+    "new_rows", "changed_prefixes" (prefix sizes whose feature set changed),
+    "ranking" (old / new rank of every feature), "scores" ({classifier: old /
+    new mean score of every prefix}), "borda_importance", "cross_val"}
+    """
+    size = os.path.getsize(csvfile)
+    snapshot = _load(state_dir)
+    appended = (
+        snapshot is not None
+        and size >= snapshot["size"]
+        and _prefix_digest(csvfile, snapshot["size"]) == snapshot["digest"]
+    )
+    if not appended:
+        df = read_csv_typed(csvfile, int_columns, dtypes)
+        models, borda_results, cross_val = _full_run(
+            df, tagname, classifiers, nsplit, n_jobs
+        )
+        feature_list = list(borda_results["Feature"])
+        report = {
+            "mode": "full",
+            "new_rows": len(df),
+            "changed_prefixes": list(range(1, len(feature_list) + 1)),
+            "ranking": _rank_diff(feature_list, feature_list),
+            "scores": {},
+        }
+    elif size == snapshot["size"]:
+        df, models = snapshot["df"], snapshot["models"]
+        borda_results, cross_val = snapshot["borda_importance"], snapshot["cross_val"]
+        feature_list = snapshot["feature_list"]
+        report = {
+            "mode": "unchanged",
+            "new_rows": 0,
+            "changed_prefixes": [],
+            "ranking": _rank_diff(feature_list, feature_list),
+            "scores": {},
+        }
+    else:
+        new_rows = read_csv_tail(csvfile, snapshot["size"], int_columns, dtypes)
+        df = pd.concat([snapshot["df"], new_rows])
+        features = [column for column in df.columns if column != tagname]
+        X = df[features].to_numpy(dtype=np.float32)
+        models = continue_boosters(
+            snapshot["models"], X, df[tagname].to_numpy(), n_rounds
+        )
+        del X
+        borda_results = _ranking(models, features)
+        feature_list = list(borda_results["Feature"])
+        changed = changed_prefixes(snapshot["feature_list"], feature_list)
+        # New folds over all the rows, so every prefix is scored again
+        cross_val = _cross_validate(
+            df, tagname, feature_list, classifiers, nsplit, n_jobs
+        )
+        scores = {
+            name: _score_diff(snapshot["cross_val"][name], cross_val[name])
+            for name in classifiers
+            if name in snapshot["cross_val"]
+        }
+        report = {
+            "mode": "appended",
+            "new_rows": len(new_rows),
+            "changed_prefixes": changed,
+            "ranking": _rank_diff(snapshot["feature_list"], feature_list),
+            "scores": scores,
+        }
+
+    _save(
+        {
+            "size": size,
+            "digest": _prefix_digest(csvfile, size),
+            "df": df,
+            "models": models,
+            "borda_importance": borda_results,
+            "feature_list": feature_list,
+            "cross_val": cross_val,
+        },
+        state_dir,
+    )
+    report.update(borda_importance=borda_results, cross_val=cross_val)
+    return report
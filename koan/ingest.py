@@ -0,0 +1,191 @@
+"""
+Typed dataset ingest with a memory-mapped columnar cache
+
+The csv is read with compact dtypes (float32, the smallest integer type that
+holds each integer column, or declared ones such as "category"), optionally
+in chunks, and stored once as one .npy file per column. Later loads of the
+same file memory-map those columns instead of parsing the csv again.
+"""
+
+import io
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from .cache import file_digest, stage_key
+
+META_FILE = "meta.json"
+
+
+# Rows parsed to tell the text columns from the numerical ones
+SNIFF_ROWS = 1000
+
+
+def _text_columns(csvfile, nrows=SNIFF_ROWS):
+    """Columns holding text in the first nrows rows of csvfile"""
+    head = pd.read_csv(csvfile, index_col=0, nrows=nrows)
+    return [column for column in head.columns if head[column].dtype.kind not in "iuf"]
+
+
+def _compact_dtypes(columns, int_columns, dtypes, text_columns=()):
+    """
+    read_csv dtypes: declared ones, int64 for integer columns, else float32
+    (text columns are left to the type inference of read_csv)
+    """
+    read_dtypes = {
+        column: np.float32 for column in columns if column not in text_columns
+    }
+    read_dtypes.update({column: np.int64 for column in int_columns})
+    read_dtypes.update(dtypes or {})
+    return read_dtypes
+
+
+def _not_numeric(csvfile, read_dtypes):
+    """First float32 column of read_dtypes holding text further down csvfile"""
+    df = pd.read_csv(csvfile, index_col=0)
+    for column, dtype in read_dtypes.items():
+        if dtype is np.float32 and df[column].dtype.kind not in "iuf":
+            return column
+    return None
+
+
+def read_csv_typed(csvfile, int_columns=(), dtypes=None, chunksize=None):
+    """
+    csvfile: csv file with the row index in its first column
+    int_columns: columns stored with the smallest integer type holding them
+    dtypes: {column: dtype} overriding the defaults, e.g. "category" for
+            non numerical columns (the other columns are read as float32,
+            except the ones holding text in the first SNIFF_ROWS rows)
+    chunksize: rows parsed at a time, bounding the memory of the parser
+    """
+    columns = pd.read_csv(csvfile, index_col=0, nrows=0).columns
+    read_dtypes = _compact_dtypes(columns, int_columns, dtypes, _text_columns(csvfile))
+    try:
+        if chunksize is None:
+            df = pd.read_csv(csvfile, index_col=0, dtype=read_dtypes)
+        else:
+            chunks = pd.read_csv(
+                csvfile, index_col=0, dtype=read_dtypes, chunksize=chunksize
+            )
+            df = pd.concat(chunks)
+    except ValueError as error:
+        column = _not_numeric(csvfile, read_dtypes)
+        if column is None:
+            raise
+        raise ValueError(
+            f"Not numeric column: {column} (declare its dtype with the dtypes "
+            f'option, e.g. {{"{column}": "category"}})'
+        ) from error
+    for column in int_columns:
+        df[column] = pd.to_numeric(df[column], downcast="integer")
+    return df
+
+
+def read_csv_tail(csvfile, offset, int_columns=(), dtypes=None):
+    """
+    The rows of csvfile after byte offset (the start of a line), parsed with
+    the columns of its header and the dtypes of read_csv_typed
+    """
+    with open(csvfile, "rb") as fh:
+        header = fh.readline()
+        fh.seek(offset)
+        tail = fh.read()
+    columns = pd.read_csv(io.BytesIO(header), index_col=0, nrows=0).columns
+    df = pd.read_csv(
+        io.BytesIO(header + tail),
+        index_col=0,
+        dtype=_compact_dtypes(columns, int_columns, dtypes, _text_columns(csvfile)),
+    )
+    for column in int_columns:
+        df[column] = pd.to_numeric(df[column], downcast="integer")
+    return df
+
+
+def _save_column(values, path):
+    """Store one column as .npy, returns its json description"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        np.save(path, values.cat.codes.to_numpy())
+        return {"kind": "category", "categories": values.cat.categories.tolist()}
+    values = values.to_numpy()
+    if values.dtype == object:
+        values = values.astype(str)
+    np.save(path, values)
+    return {"kind": "array"}
+
+
+def _load_column(path, meta):
+    values = np.load(path, mmap_mode="r")
+    if meta["kind"] == "category":
+        return pd.Categorical.from_codes(values, meta["categories"])
+    return values
+
+
+def save_columnar(df, directory):
+    """Write df (index included) as one .npy file per column"""
+    os.makedirs(directory, exist_ok=True)
+    meta = {
+        "index_name": df.index.name,
+        "index": _save_column(df.index.to_series(), os.path.join(directory, "index")),
+        "columns": [
+            [column, _save_column(df[column], os.path.join(directory, f"{i}"))]
+            for i, column in enumerate(df.columns)
+        ],
+    }
+    # The meta file is written last, it marks the cache as complete
+    with open(os.path.join(directory, META_FILE), "w") as fh:
+        json.dump(meta, fh)
+
+
+def load_columnar(directory):
+    """DataFrame over the memory-mapped columns written by save_columnar"""
+    with open(os.path.join(directory, META_FILE)) as fh:
+        meta = json.load(fh)
+    index = pd.Index(
+        _load_column(os.path.join(directory, "index.npy"), meta["index"]),
+        name=meta["index_name"],
+    )
+    data = {
+        column: _load_column(os.path.join(directory, f"{i}.npy"), column_meta)
+        for i, (column, column_meta) in enumerate(meta["columns"])
+    }
+    return pd.DataFrame(data, index=index, copy=False)
+
+
+def columnar_cache(csvfile, cache_dir, int_columns=(), dtypes=None, chunksize=None):
+    """
+    Directory of the columnar copy of csvfile in cache_dir (keyed by the file
+    contents and the dtypes), written by read_csv_typed and save_columnar if
+    missing; load_columnar memory-maps it
+    """
+    key = stage_key(file_digest(csvfile), list(int_columns), dtypes)
+    directory = os.path.join(cache_dir, f"ingest-{key}")
+    if os.path.exists(os.path.join(directory, META_FILE)):
+        return directory
+    # Written aside and renamed into place, so concurrent stages never read
+    # (or write into) a partial copy
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir, suffix=".tmp")
+    try:
+        save_columnar(read_csv_typed(csvfile, int_columns, dtypes, chunksize), tmp_dir)
+        os.rename(tmp_dir, directory)
+    except OSError:
+        # Another stage renamed its copy first
+        if not os.path.exists(os.path.join(directory, META_FILE)):
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return directory
+
+
+def load_dataset(csvfile, int_columns=(), dtypes=None, chunksize=None, cache_dir=None):
+    """
+    read_csv_typed, through a columnar cache in cache_dir (see columnar_cache)
+    when it is given
+    """
+    if cache_dir is None:
+        return read_csv_typed(csvfile, int_columns, dtypes, chunksize)
+    return load_columnar(
+        columnar_cache(csvfile, cache_dir, int_columns, dtypes, chunksize)
+    )
@@ -0,0 +1,164 @@
+"""
+Stage instrumentation
+
+measure wraps one stage call and records its wall time, CPU time, resident
+memory (before, after and sampled peak), the shapes of its tabular inputs
+and output and the thread counts, with an optional cProfile capture. The
+records of a run are written as a json manifest next to its figures.
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import platform
+import resource
+import threading
+from threadpoolctl import threadpool_info
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+# Seconds between two resident memory samples of a running stage
+RSS_INTERVAL = 0.01
+
+
+def _usage():
+    return [
+        resource.getrusage(resource.RUSAGE_SELF),
+        resource.getrusage(resource.RUSAGE_CHILDREN),
+    ]
+
+
+def _cpu_seconds():
+    return sum(u.ru_utime + u.ru_stime for u in _usage())
+
+
+def _peak_rss_mb():
+    return max(u.ru_maxrss for u in _usage()) * _RSS_UNIT / 1024**2
+
+
+def _rss_mb():
+    """
+    Current resident memory of the process, its high-water mark so far where
+    there is no /proc (macOS)
+    """
+    try:
+        with open("/proc/self/statm") as fh:
+            pages = int(fh.read().split()[1])
+    except OSError:
+        return _peak_rss_mb()
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+
+
+class _RssSampler(threading.Thread):
+    """Highest resident memory sampled every interval seconds until stop()"""
+
+    def __init__(self, interval=RSS_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = _rss_mb()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, _rss_mb())
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.peak = max(self.peak, _rss_mb())
+        return self.peak
+
+
+def _shapes(value):
+    """[rows, columns] of a DataFrame / array, of each one in a dict"""
+    shape = getattr(value, "shape", None)
+    if shape is not None and 1 <= len(shape) <= 2:
+        return [int(n) for n in shape] + [1] * (2 - len(shape))
+    if isinstance(value, dict):
+        shapes = {str(k): _shapes(v) for k, v in value.items()}
+        return {k: v for k, v in shapes.items() if v} or None
+    return None
+
+
+def _threads():
+    pools = threadpool_info()
+    return {
+        "python": threading.active_count(),
+        "native": max((pool["num_threads"] for pool in pools), default=1),
+    }
+
+
+def _profile_path(profile_dir, name):
+    os.makedirs(profile_dir, exist_ok=True)
+    return os.path.join(profile_dir, name.replace("/", "__") + ".prof")
+
+
+def measure(func, args=(), kwargs=None, name=None, profile_dir=None):
+    """
+    Call func(*args, **kwargs), returns (result, record)
+    record: {"start", "end", "duration", "cpu", "rss_start_mb", "rss_end_mb",
+             "peak_rss_mb", "pid", "inputs", "output", "threads"},
+             start/end being epoch seconds, cpu the CPU seconds of the process
+             and its reaped children, rss_start_mb/rss_end_mb the resident
+             memory of the process before/after the call and peak_rss_mb the
+             highest one sampled during the call (memory of child processes,
+             e.g. joblib workers, excluded), inputs/output the [rows, columns]
+             of the tabular values
+    profile_dir: when given, the call is profiled with cProfile and the
+                 stats are dumped to <profile_dir>/<name>.prof
+    """
+    kwargs = kwargs or {}
+    inputs = {k: s for k, s in ((k, _shapes(v)) for k, v in kwargs.items()) if s}
+    profiler = cProfile.Profile() if profile_dir is not None else None
+    sampler = _RssSampler()
+    rss_start = sampler.peak
+    cpu = _cpu_seconds()
+    start = time.time()
+    sampler.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        peak_rss = sampler.stop()
+    end = time.time()
+    record = {
+        "start": start,
+        "end": end,
+        "duration": end - start,
+        "cpu": _cpu_seconds() - cpu,
+        "rss_start_mb": rss_start,
+        "rss_end_mb": _rss_mb(),
+        "peak_rss_mb": peak_rss,
+        "pid": os.getpid(),
+        "inputs": inputs,
+        "output": _shapes(result),
+        "threads": _threads(),
+    }
+    if profiler is not None:
+        record["profile"] = _profile_path(profile_dir, name or func.__name__)
+        profiler.dump_stats(record["profile"])
+    return result, record
+
+
+def write_manifest(path, timeline, **run_info):
+    """
+    Write the stage records of a run as json to path
+    run_info: extra run description (arguments, dataset...) stored under "run"
+    """
+    manifest = {
+        "run": run_info,
+        "host": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "stages": timeline,
+    }
+    with open(path, "w") as fh:
+        json.dump(manifest, fh, indent=2, default=str)
+    return path
@@ -6,37 +6,21 @@ from matplotlib.lines import Line2D
 import matplotlib.gridspec as gridspec
 from matplotlib import rcParams
 import seaborn as sns
-from sklearn.decomposition import PCA
-from sklearn.manifold import TSNE
-import umap
+from .correlation import clustered_submatrix, correlation_matrix
+from .embeddings import compute_embeddings
 from .utilities import create_save_path
 from .params import COLORS
 
 rcParams["savefig.dpi"] = 600
 
 
-def calc_pca(df, tag, is_3d=False):
-    if is_3d:
-        pc3d = PCA(n_components=3).fit_transform(df)
-        df_pc3d = pd.DataFrame(data=pc3d, columns=["PC 1", "PC 2", "PC 3"])
-        df_final3d = pd.concat([df_pc3d, tag[["Tag"]]], axis=1)
-        return df_final3d
-    prc = PCA(n_components=2).fit_transform(df)
-    df_prc = pd.DataFrame(data=prc, columns=["PC 1", "PC 2"])
-    df_prc = pd.concat([df_prc, tag[["Tag"]]], axis=1)
-    return df_prc
-
-
-def calc_umap(df, is_3d=False):
-    if is_3d:
-        return umap.UMAP(n_components=3).fit_transform(df)
-    return umap.UMAP().fit_transform(df)
-
-
-def calc_tsne(df, is_3d=False):
-    if is_3d:
-        return TSNE(n_components=3, random_state=0).fit_transform(df.copy())
-    return TSNE(n_components=2, random_state=0).fit_transform(df.copy())
+def savefig(sampling_type, name, results_path):
+    """Save the current figure as <name>.<savefig.format> and close it"""
+    savepath = create_save_path(
+        sampling_type, f"{name}.{rcParams['savefig.format']}", results_path
+    )
+    plt.savefig(savepath, bbox_inches="tight")
+    plt.close()
 
 
 def makefig(tag, names=["PCA", "UMAP", "t-SNE"]):
@@ -117,41 +101,40 @@ def subplt(axis, title, targets, dfd, tag, loc=True, is3d=False):
             axis.scatter(dfd1, dfd2, c=color, edgecolors="gray", alpha=0.77)
 
 
-def plot_dimensionality_reduction(df, tag_vals, sampling_type, results_path):
-    tag = df[["anyadr"]]
-    tag["anyadr"] = tag["anyadr"].replace(tag_vals)
-    tag.rename(columns={"anyadr": "Tag"}, inplace=True)
-
-    df_dropped = df.drop(columns=["anyadr"])
-
-    principalDf = calc_pca(df_dropped, tag)
-    umap_data_2D = calc_umap(df_dropped)
-    tsne_data_2D = calc_tsne(df_dropped)
-    finalDf3D = calc_pca(df_dropped, tag, True)
-    umap_data_3D = calc_umap(df_dropped, True)
-    tsne_data_3D = calc_tsne(df_dropped, True)
+def plot_dimensionality_reduction(
+    df, tag_vals, sampling_type, results_path, embeddings=None, tagname="anyadr"
+):
+    """
+    embeddings: precomputed compute_embeddings(df, tagname) result,
+                df is not used (and can be None) when it is given
+    """
+    if embeddings is None:
+        embeddings = compute_embeddings(df, tagname)
+    tag = pd.DataFrame({"Tag": pd.Series(embeddings["labels"]).replace(tag_vals)})
 
     targets = tag_vals.values()
     ax1, ax2 = makefig(tag, names=["PCA ", "UMAP", "t-SNE"])
-    subplt(ax1[0], "PCA 2D", targets, principalDf, tag, loc=True, is3d=False)
-    subplt(ax1[1], "UMAP 2D", targets, umap_data_2D, tag, loc=False, is3d=False)
-    subplt(ax1[2], "t-SNE 2D", targets, tsne_data_2D, tag, loc=False, is3d=False)
-    subplt(ax2[0], "PCA 3D", targets, finalDf3D, tag, loc=True, is3d=True)
-    subplt(ax2[1], "UMAP 3D", targets, umap_data_3D, tag, loc=False, is3d=True)
-    subplt(ax2[2], "t-SNE 3D", targets, tsne_data_3D, tag, loc=False, is3d=True)
+    for axis, title in zip(
+        ax1 + ax2, ["PCA 2D", "UMAP 2D", "t-SNE 2D", "PCA 3D", "UMAP 3D", "t-SNE 3D"]
+    ):
+        is3d = title.endswith("3D")
+        subplt(axis, title, targets, embeddings[title], tag, loc=False, is3d=is3d)
     # ax2[2].zaxis.labelpad = -0.95
-    savepath = create_save_path(
-        sampling_type, f"dim_reduct_{sampling_type}.png", results_path
-    )
-    plt.savefig(savepath, bbox_inches="tight")
-    plt.close()
-
+    savefig(sampling_type, f"dim_reduct_{sampling_type}", results_path)
 
-def plot_correlation_heatmap(df, sampling_type, results_path):
-    # Compute pairwise correlation of columns,
-    # excluding NA/null values.
 
-    corr_matrix = df.corr(method="pearson")
+def plot_correlation_heatmap(
+    df, sampling_type, results_path, corr_matrix=None, max_features=60
+):
+    """
+    corr_matrix: precomputed correlation_matrix(df), df is not used
+                 (and can be None) when it is given
+    max_features: wider matrices are reduced to their clustered submatrix
+    """
+    if corr_matrix is None:
+        corr_matrix = correlation_matrix(df)
+    if len(corr_matrix) > max_features:
+        corr_matrix = clustered_submatrix(corr_matrix, max_features)
 
     # Set up the matplotlib figure
     f, ax = plt.subplots(figsize=(20, 10))
@@ -167,11 +150,7 @@ def plot_correlation_heatmap(df, sampling_type, results_path):
         fmt=".1f",
     )
 
-    savepath = create_save_path(
-        sampling_type, f"corr_heatmap_{sampling_type}.png", results_path
-    )
-    plt.savefig(savepath, bbox_inches="tight")
-    plt.close()
+    savefig(sampling_type, f"corr_heatmap_{sampling_type}", results_path)
 
 
 def plot_boxplots(
@@ -181,12 +160,17 @@ def plot_boxplots(
     sampling_type,
     ylabel_text,
     results_path,
+    n_features=None,
+    recommended=None,
 ):
 
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
     bp = ax.boxplot(metrics, patch_artist=True)  # Note: patch_artist=True
+    # Only some prefixes were evaluated, label the boxes with their sizes
+    if n_features is not None:
+        ax.set_xticklabels(n_features)
 
     params = {
         "axes.labelsize": 8,
@@ -237,22 +221,28 @@ def plot_boxplots(
         bp["caps"][i * 2].set_color("black")
         bp["caps"][i * 2 + 1].set_color("black")
 
+    # Mark the recommended number of features of an adaptive search
+    title = f"{classifier_name} performance"
+    if recommended is not None:
+        sizes = list(n_features) if n_features is not None else range(1, num_boxes + 1)
+        position = list(sizes).index(recommended) + 1
+        ax.axvline(position, color="black", linestyle="--", linewidth=1)
+        title += f" (recommended: {recommended} features)"
+
     # Further plot adjustments...
-    plt.title(f"{classifier_name} performance")
+    plt.title(title)
     plt.ylabel(ylabel_text)
     plt.xlabel("No. of Borda consensus ranked features")
-    # sampling_type, f"corr_heatmap_{sampling_type}.png", results_path
-    savepath = create_save_path(
+    savefig(
         sampling_type,
-        f"box_plots_{classifier_name}_{ylabel_text}_{sampling_type}.png",
+        f"box_plots_{classifier_name}_{ylabel_text}_{sampling_type}",
         results_path,
     )
-    plt.savefig(savepath, bbox_inches="tight")
-    plt.close()
 
 
 def plot_boxplot_metrics(cross_val_data, sampling_type, results_path):
     classifier_name = cross_val_data["classifier_name"]
+    recommended = cross_val_data.get("recommended")
     for score_name, results in cross_val_data["scores"].items():
         #   metrics, classifier_name, sampling_type, ylabel_text,results_path,
         plot_boxplots(
@@ -261,6 +251,12 @@ def plot_boxplot_metrics(cross_val_data, sampling_type, results_path):
             sampling_type=sampling_type,
             ylabel_text=score_name,
             results_path=results_path,
+            n_features=cross_val_data.get("n_features"),
+            recommended=(
+                recommended["n_features"]
+                if recommended is not None and recommended["metric"] == score_name
+                else None
+            ),
         )
 
 
@@ -277,20 +273,49 @@ def plot_borda_importance(borda_results, sampling_type, results_path):
     x_start = borda_results["Borda Rank"].min()
     ax.set_xlim(left=x_start)
     ax.set_facecolor("whitesmoke")
-    for _, row in borda_results.iterrows():
-        ax.plot(
-            [x_start, row["Borda Rank"]],
-            [row["Feature"], row["Feature"]],
-            color="steelblue",
-            linewidth=0.5,
-        )
+    # One LineCollection for all the stems
+    ax.hlines(
+        y=borda_results["Feature"],
+        xmin=x_start,
+        xmax=borda_results["Borda Rank"],
+        color="steelblue",
+        linewidth=0.5,
+    )
     ax.set_title("Borda Consensus Feature Importance")
     ax.set_xlabel("Importance")
     ax.set_ylabel("Feature")
     ax.legend_.remove()
     plt.tight_layout()
-    savepath = create_save_path(
-        sampling_type, f"borda_importance_{sampling_type}.png", results_path
+    savefig(sampling_type, f"borda_importance_{sampling_type}", results_path)
+
+
+def plot_stability(stability, sampling_type, results_path, n_top=30):
+    """
+    Bootstrap rank interval of the n_top features of lowest mean rank,
+    coloured by their top k selection frequency
+    """
+    top = stability.head(n_top).iloc[::-1]
+    fig, ax = plt.subplots(figsize=(8, max(3, 0.25 * len(top) + 1)))
+    ax.hlines(
+        y=top["Feature"],
+        xmin=top["rank_low"],
+        xmax=top["rank_high"],
+        color="lightgray",
+        linewidth=3,
     )
-    plt.savefig(savepath, bbox_inches="tight")
-    plt.close()
+    points = ax.scatter(
+        top["mean_rank"],
+        top["Feature"],
+        c=top["selection_frequency"],
+        cmap="viridis",
+        vmin=0,
+        vmax=1,
+        zorder=3,
+    )
+    fig.colorbar(points, ax=ax, label="Top k selection frequency")
+    ax.set_facecolor("whitesmoke")
+    ax.set_title(f"Borda rank stability ({stability.attrs.get('n_draws', '?')} draws)")
+    ax.set_xlabel("Rank (mean and interval)")
+    ax.set_ylabel("Feature")
+    plt.tight_layout()
+    savefig(sampling_type, f"borda_stability_{sampling_type}", results_path)
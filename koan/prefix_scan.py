@@ -0,0 +1,166 @@
+"""
+Prefix scan classifiers
+
+The Borda prefix of k + 1 features is a superset of the prefix of k features,
+so instead of refitting from scratch per prefix these classifiers walk the
+feature list once per fold and yield the test predictions of every prefix.
+They can be used in place of an sklearn estimator in the classifiers dict
+given to workflow / cross_val_exp.
+"""
+
+import numpy as np
+from scipy.linalg import solve_triangular
+from sklearn.base import BaseEstimator, clone
+from sklearn.linear_model import LogisticRegression
+
+
+class PrefixScan(BaseEstimator):
+    """Base class of the prefix scan classifiers"""
+
+    def scan(self, X_train, y_train, X_test):
+        """
+        X_train, X_test: feature matrices with columns in Borda order
+        Yields (y_pred, proba) on X_test for the prefixes 1..n_features,
+        proba having one column per class (sorted class labels).
+        """
+        raise NotImplementedError
+
+
+def _softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    np.exp(scores, out=scores)
+    return scores / scores.sum(axis=1, keepdims=True)
+
+
+class LDAPrefixScan(PrefixScan):
+    """
+    Linear discriminant analysis grown one feature at a time.
+
+    The class means and the within class covariance (the class covariances
+    weighted by the priors, as in sklearn's LinearDiscriminantAnalysis with
+    the lsqr / eigen solvers) are computed once per fold. Every new feature
+    extends the Cholesky factor of the covariance by one row, and with it the
+    whitened class means and test samples, so a prefix costs O(n_samples * k)
+    instead of a full refit.
+    priors: class priors, estimated from the training fold when None
+    tol: features whose variance left after the previous ones is below
+         tol * their variance are collinear and skipped
+    """
+
+    def __init__(self, priors=None, tol=1e-10):
+        self.priors = priors
+        self.tol = tol
+
+    def scan(self, X_train, y_train, X_test):
+        classes, y_idx = np.unique(y_train, return_inverse=True)
+        n_samples, n_features = X_train.shape
+        n_classes = len(classes)
+        counts = np.bincount(y_idx, minlength=n_classes)
+        priors = counts / n_samples if self.priors is None else np.asarray(self.priors)
+
+        means = np.zeros((n_classes, n_features))
+        np.add.at(means, y_idx, X_train)
+        means /= counts[:, None]
+        centered = X_train - means[y_idx]
+        weights = (priors / counts)[y_idx]
+        cov = (centered * weights[:, None]).T @ centered
+
+        # Cholesky factor, whitened means and test samples of the active features
+        chol = np.zeros((n_features, n_features))
+        white_means = np.zeros((n_classes, n_features))
+        white_test = np.zeros((X_test.shape[0], n_features))
+        active = []
+        # Discriminant scores: white_test @ white_means.T - |white_means|^2 / 2
+        cross = np.zeros((X_test.shape[0], n_classes))
+        norms = np.zeros(n_classes)
+
+        for j in range(n_features):
+            r = len(active)
+            row = (
+                solve_triangular(chol[:r, :r], cov[active, j], lower=True)
+                if r
+                else np.zeros(0)
+            )
+            pivot = cov[j, j] - row @ row
+            if cov[j, j] > 0 and pivot > self.tol * cov[j, j]:
+                pivot = np.sqrt(pivot)
+                chol[r, :r] = row
+                chol[r, r] = pivot
+                white_means[:, r] = (means[:, j] - white_means[:, :r] @ row) / pivot
+                white_test[:, r] = (X_test[:, j] - white_test[:, :r] @ row) / pivot
+                cross += np.outer(white_test[:, r], white_means[:, r])
+                norms += white_means[:, r] ** 2
+                active.append(j)
+            proba = _softmax(cross - 0.5 * norms + np.log(priors))
+            yield classes[proba.argmax(axis=1)], proba
+
+
+class LogisticPrefixScan(PrefixScan):
+    """
+    Logistic regression warm started from the coefficients of the previous
+    prefix, with a zero coefficient for the newly added feature.
+    estimator: LogisticRegression to use (its solver must support warm_start)
+    """
+
+    def __init__(self, estimator=None):
+        self.estimator = estimator
+
+    def scan(self, X_train, y_train, X_test):
+        estimator = LogisticRegression() if self.estimator is None else self.estimator
+        estimator = clone(estimator).set_params(warm_start=True)
+        for k in range(1, X_train.shape[1] + 1):
+            if k > 1:
+                estimator.coef_ = np.hstack(
+                    [estimator.coef_, np.zeros((estimator.coef_.shape[0], 1))]
+                )
+            estimator.fit(X_train[:, :k], y_train)
+            yield estimator.predict(X_test[:, :k]), estimator.predict_proba(
+                X_test[:, :k]
+            )
+
+
+# Test rows per argpartition call, its int64 indices would otherwise be
+# twice the size of the distance block
+_ROW_BLOCK = 256
+
+
+def _nearest(dist, n_neighbors):
+    """Columns of the n_neighbors smallest distances of each row"""
+    nearest = np.empty((len(dist), n_neighbors), dtype=np.intp)
+    for i in range(0, len(dist), _ROW_BLOCK):
+        block = np.argpartition(dist[i : i + _ROW_BLOCK], n_neighbors - 1, axis=1)
+        nearest[i : i + _ROW_BLOCK] = block[:, :n_neighbors]
+    return nearest
+
+
+class KNNPrefixScan(PrefixScan):
+    """
+    k nearest neighbours classifier (uniform weights, euclidean distance).
+
+    Squared euclidean distance is additive over features, so a float32
+    test x train distance block is kept per fold and every new feature only
+    adds its own contribution. The neighbours of each prefix are then picked
+    with argpartition, O(n_test * n_train) per prefix.
+    n_neighbors: number of neighbours voting for a test sample
+    """
+
+    def __init__(self, n_neighbors=5):
+        self.n_neighbors = n_neighbors
+
+    def scan(self, X_train, y_train, X_test):
+        classes, y_idx = np.unique(y_train, return_inverse=True)
+        X_train = np.asarray(X_train, dtype=np.float32)
+        X_test = np.asarray(X_test, dtype=np.float32)
+        n_neighbors = min(self.n_neighbors, len(X_train))
+
+        dist = np.zeros((len(X_test), len(X_train)), dtype=np.float32)
+        diff = np.empty_like(dist)
+        for j in range(X_train.shape[1]):
+            np.subtract.outer(X_test[:, j], X_train[:, j], out=diff)
+            np.square(diff, out=diff)
+            dist += diff
+            votes = y_idx[_nearest(dist, n_neighbors)]
+            proba = np.stack(
+                [(votes == c).mean(axis=1) for c in range(len(classes))], axis=1
+            )
+            yield classes[proba.argmax(axis=1)], proba
@@ -1,5 +1,5 @@
 import pandas as pd
-from .utilities import dataframe_columns2integer
+from .ingest import load_dataset
 from .sampling import sampling
 
 
@@ -8,11 +8,28 @@ def preprocess(
     int_columns: list,
     tagname: str,
     sampling_method: str,
+    dtypes: dict = None,
+    chunksize: int = None,
+    ingest_dir: str = None,
+    random_state: int = 42,
+    neighbors: str = "exact",
 ) -> pd.DataFrame:
     """
     sampling_method: ["no", "undersampling", "smote"]
+    dtypes: declared column dtypes, the other columns are read as float32
+            and int_columns as the smallest integer type holding them
+    chunksize: parse the csv that many rows at a time
+    ingest_dir: directory of the memory-mapped columnar copy of the csv,
+                parsed once and reused while the file is unchanged
+    random_state: seed of the resampling
+    neighbors: "exact" or "approximate" neighbour search of SMOTE
     """
-    df = pd.read_csv(csvfile, index_col=0)
-    df = dataframe_columns2integer(df, int_columns)
-    df = sampling(df, tag_name=tagname, typos=sampling_method)
+    df = load_dataset(csvfile, int_columns, dtypes, chunksize, ingest_dir)
+    df = sampling(
+        df,
+        tag_name=tagname,
+        typos=sampling_method,
+        random_state=random_state,
+        neighbors=neighbors,
+    )
     return df
@@ -1,17 +1,63 @@
-from pycaret import classification as clf
-from .utilities import move_file_to_subdir
+import os
+from . import threads
+from .cache import cached, stage_key
+from .utilities import create_save_path
 
 
-def exec_pycaret(df, tag_name, sampling_type, result_path):
+def exec_pycaret(
+    df,
+    tag_name,
+    sampling_type,
+    result_path,
+    include=None,
+    turbo=True,
+    fold=10,
+    n_jobs=None,
+    budget_time=None,
+    cache=None,
+    data_key=None,
+):
+    """
+    include: shortlist of PyCaret model ids compared (all models when None)
+    turbo: skip the slowest models
+    fold: cross validation folds of the comparison
+    n_jobs: processes PyCaret may use (the thread budget when None)
+    budget_time: wall-clock cap of compare_models, in minutes
+    cache, data_key: StageCache and dataset key; the leaderboard is cached
+                     and only the best model is refitted on a cache hit
+    Returns the compare_models leaderboard.
+    """
+    from pycaret.classification import ClassificationExperiment
 
-    s = clf.setup(df, target=tag_name, session_id=123)
-    best = clf.compare_models()
+    # An experiment object rather than the global pycaret state, so several
+    # runs can share a process
+    exp = ClassificationExperiment()
+    exp.setup(
+        df,
+        target=tag_name,
+        session_id=123,
+        fold=fold,
+        n_jobs=n_jobs or threads.available(),
+        html=False,
+        verbose=False,
+    )
 
-    clf.plot_model(best, plot="confusion_matrix", save=True)
-    move_file_to_subdir("Confusion Matrix.png", sampling_type, result_path)
+    best = None
 
-    clf.plot_model(best, plot="error", save=True)
-    move_file_to_subdir("Prediction Error.png", sampling_type, result_path)
+    def compare():
+        nonlocal best
+        best = exp.compare_models(
+            include=include, turbo=turbo, budget_time=budget_time, verbose=False
+        )
+        return exp.pull()
 
-    clf.plot_model(best, plot="class_report", save=True)
-    move_file_to_subdir("Class Report.png", sampling_type, result_path)
+    key = stage_key(data_key, include, turbo, fold, budget_time)
+    leaderboard = cached(cache, "pycaret", key, compare)
+    if best is None:
+        best = exp.create_model(leaderboard.index[0], verbose=False)
+
+    # Saved straight into the run folder, no files in the working directory
+    save_dir = os.path.dirname(create_save_path(sampling_type, "", result_path))
+    for plot in ("confusion_matrix", "error", "class_report"):
+        exp.plot_model(best, plot=plot, save=save_dir)
+    return leaderboard
@@ -0,0 +1,71 @@
+"""
+Figure rendering off the compute path
+
+Compute stages hand the plot ready data of a koan.plotting function to a
+RenderQueue, whose worker process draws and saves the figure with the Agg
+backend while the computations go on.
+"""
+
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+from .instrument import measure
+from . import threads
+
+
+def render(plot, dpi=600, fmt="png", **kwargs):
+    """
+    Draw koan.plotting.<plot>(**kwargs) with the Agg backend
+    dpi, fmt: resolution and file format (png, svg, pdf...) of the saved figure
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+    from . import plotting
+
+    with plt.rc_context({"savefig.dpi": dpi, "savefig.format": fmt}):
+        getattr(plotting, plot)(**kwargs)
+
+
+class RenderQueue:
+    """
+    Background renderer, use as a context manager or call close() to wait
+    for the queued figures. Rendering errors are raised by close().
+    dpi, fmt: as in render
+    max_workers: number of rendering processes
+    """
+
+    def __init__(self, dpi=600, fmt="png", max_workers=1):
+        self.dpi = dpi
+        self.fmt = fmt
+        # A fresh interpreter, so the worker does not inherit a GUI backend;
+        # drawing is single threaded, the workers take one thread each
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=get_context("spawn"),
+            initializer=threads.set_budget,
+            initargs=(1,),
+        )
+        self._futures = []
+
+    def submit(self, plot, **kwargs):
+        """
+        Queue koan.plotting.<plot>(**kwargs), returns its future, whose result
+        is (None, record of the rendering) (see koan.instrument.measure)
+        """
+        future = self._executor.submit(
+            measure, render, (plot, self.dpi, self.fmt), kwargs, plot
+        )
+        self._futures.append(future)
+        return future
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
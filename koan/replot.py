@@ -0,0 +1,143 @@
+"""
+Figures and run comparisons from the results store, no recomputation
+
+    python -m koan.replot render store --results results --dpi 300 --fmt svg
+    python -m koan.replot compare store 20240101T090000 20240108T090000
+
+render rebuilds the figures of a run (the latest by default) from the
+tables of koan.store; compare lays the mean cross validation scores of
+several runs side by side.
+"""
+
+import os
+import argparse
+import pandas as pd
+from . import store
+from .render import RenderQueue
+
+# table -> (figure, keyword argument of its data, table -> plot data)
+FIGURES = {
+    "cross_val": (
+        "plot_boxplot_metrics",
+        "cross_val_data",
+        store.cross_val_from_table,
+    ),
+    "borda": ("plot_borda_importance", "borda_results", store.borda_from_table),
+    "stability": ("plot_stability", "stability", store.stability_from_table),
+    "embeddings": (
+        "plot_dimensionality_reduction",
+        "embeddings",
+        store.embeddings_from_table,
+    ),
+    "correlation": (
+        "plot_correlation_heatmap",
+        "corr_matrix",
+        store.correlation_from_table,
+    ),
+}
+
+
+def _figure_kwargs(table, keys, rows, results_path, tag_vals):
+    """Keyword arguments of the koan.plotting function of a stage's rows"""
+    _, _, target, sampling, _ = keys
+    plot, data_kwarg, from_table = FIGURES[table]
+    kwargs = {
+        data_kwarg: from_table(rows),
+        "sampling_type": sampling,
+        "results_path": os.path.join(results_path, target) if target else results_path,
+    }
+    if table in ("embeddings", "correlation"):
+        kwargs["df"] = None
+    if table == "embeddings":
+        kwargs["tag_vals"] = tag_vals
+    return plot, kwargs
+
+
+def replot(store_dir, results_path, run=None, dpi=600, fmt="png", max_workers=1):
+    """
+    Render the figures of run (the latest one if None) from the store
+    results_path, dpi, fmt: as in workflow
+    max_workers: rendering processes
+    Returns the number of plotting calls (a boxplot call draws one figure
+    per score).
+    """
+    run_ids = store.runs(store_dir)
+    if not run_ids:
+        raise ValueError(f"Not existing store: {store_dir}")
+    run = run or run_ids[-1]
+    if run not in run_ids:
+        raise ValueError(f"Not existing run: {run}")
+    # json keys are strings, the tag values are numbers
+    tag_vals = store.run_options(store_dir, run).get("tag_vals") or {}
+    tag_vals = {float(k): v for k, v in tag_vals.items()}
+
+    n_figures = 0
+    with RenderQueue(dpi, fmt, max_workers) as render_queue:
+        for table in FIGURES:
+            rows = store.read_table(store_dir, table, [run])
+            for keys, group in rows.groupby(store.KEYS, dropna=False, sort=False):
+                keys = [None if pd.isna(key) else key for key in keys]
+                plot, kwargs = _figure_kwargs(
+                    table, keys, group, results_path, tag_vals
+                )
+                render_queue.submit(plot, **kwargs)
+                n_figures += 1
+    return n_figures
+
+
+def compare_runs(store_dir, run_ids=None):
+    """
+    Mean cross validation score of every (target, sampling, classifier,
+    score, number of features), one column per run (all runs if None)
+    """
+    rows = store.read_table(store_dir, "cross_val", run_ids)
+    keys = ["target", "sampling", "classifier", "score", "n_features"]
+    means = (
+        rows.fillna({"target": ""})
+        .groupby(keys + ["run"])["value"]
+        .mean()
+        .unstack("run")
+    )
+    if run_ids is not None:
+        means = means[[run for run in run_ids if run in means.columns]]
+    if means.shape[1] == 2:
+        means["change"] = means.iloc[:, 1] - means.iloc[:, 0]
+    return means.reset_index()
+
+
+def parser():
+    parser = argparse.ArgumentParser(
+        prog="koan.replot", description="Figures and comparisons from the store"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    render = commands.add_parser("render", help="rebuild the figures of a run")
+    render.add_argument("store", help="results store directory")
+    render.add_argument("--run", help="run id (the latest run)")
+    render.add_argument("--results", default="results", help="figures root")
+    render.add_argument("--dpi", type=int, default=600)
+    render.add_argument("--fmt", default="png", help="png, svg, pdf...")
+    render.add_argument("--max-workers", type=int, default=1)
+    compare = commands.add_parser("compare", help="mean scores of several runs")
+    compare.add_argument("store", help="results store directory")
+    compare.add_argument("runs", nargs="*", help="run ids (all runs)")
+    compare.add_argument("--output", help="csv file of the comparison")
+    return parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    if args.command == "render":
+        n_figures = replot(
+            args.store, args.results, args.run, args.dpi, args.fmt, args.max_workers
+        )
+        print(f"{n_figures} plots rendered under {args.results}")
+        return 0
+    comparison = compare_runs(args.store, args.runs or None)
+    if args.output:
+        comparison.to_csv(args.output, index=False)
+    print(comparison.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
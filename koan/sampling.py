@@ -2,53 +2,124 @@
 functions to do sampling
 """
 
+import numpy as np
 import pandas as pd
-from sklearn.utils import resample
-from imblearn.over_sampling import SMOTE
-
-
-def _undersampling(df, tag_name="anyadr"):
-    # Separate the majority and minority classes
-    class_distro = dict(df[tag_name].value_counts())
-    lst = list(class_distro.values())
-    ks = list(class_distro.keys())
-    df_minority = df[df[tag_name] == ks[lst.index(min(lst))]]
-    df_majority = df[df[tag_name] == ks[lst.index(max(lst))]]
-    # Find the number of observations in the minority class
-    n_minority = len(df_minority)
-    # Downsample the majority class to match the minority class size
-    df_majority_downsampled = resample(
-        df_majority, replace=False, n_samples=n_minority  # sample without replacement
-    )  # to match minority class
-    df_balanced = pd.concat([df_majority_downsampled, df_minority])
-    return df_balanced
-
-
-def _smote_oversampling(df, tag_name="anyadr"):
-    # Separate features and target variable
-    X = df.drop(tag_name, axis=1)  # Features
-    y = df[tag_name]  # Target variable
-    # Initialize SMOTE
-    smote = SMOTE(random_state=42)
-    # Apply SMOTE to your data
-    df_balanced, tag_resampled = smote.fit_resample(X, y)
-    df_balanced[tag_name] = tag_resampled
-    return df_balanced
-
-
-def sampling(df, *, tag_name, typos):
+from sklearn.base import BaseEstimator
+from scipy.sparse import csr_matrix
+
+
+class ApproximateNeighbors(BaseEstimator):
+    """
+    Approximate nearest neighbours (pynndescent) with the kneighbors API SMOTE
+    expects, for datasets where exact neighbour search dominates oversampling
+    """
+
+    def __init__(self, n_neighbors=6, random_state=None):
+        self.n_neighbors = n_neighbors
+        self.random_state = random_state
+
+    def fit(self, X, y=None):
+        from pynndescent import NNDescent
+
+        self.index_ = NNDescent(
+            X, n_neighbors=self.n_neighbors, random_state=self.random_state
+        )
+        self.fit_X_ = X
+        return self
+
+    def kneighbors(self, X=None, n_neighbors=None, return_distance=True):
+        n_neighbors = n_neighbors or self.n_neighbors
+        if X is None or X is self.fit_X_:
+            # The neighbour graph of the fitted samples is built by fit already
+            indices, distances = self.index_.neighbor_graph
+            indices, distances = indices[:, :n_neighbors], distances[:, :n_neighbors]
+        else:
+            indices, distances = self.index_.query(X, k=n_neighbors)
+        return (distances, indices) if return_distance else indices
+
+    def kneighbors_graph(self, X=None, n_neighbors=None, mode="connectivity"):
+        distances, indices = self.kneighbors(X, n_neighbors)
+        values = distances if mode == "distance" else np.ones_like(distances)
+        n_rows, n_neighbors = indices.shape
+        indptr = np.arange(0, n_rows * n_neighbors + 1, n_neighbors)
+        return csr_matrix(
+            (values.ravel(), indices.ravel(), indptr),
+            shape=(n_rows, len(self.fit_X_)),
+        )
+
+
+def sample_indices(y, typos, random_state=42):
+    """
+    Row positions of the resampled dataset, for the sampling types that only
+    select existing rows:
+    no            : all the rows
+    undersampling : every class downsampled to the size of the smallest one
+    """
+    y = np.asarray(y)
+    if typos == "no":
+        return np.arange(len(y))
+    if typos == "undersampling":
+        rng = np.random.default_rng(random_state)
+        classes, counts = np.unique(y, return_counts=True)
+        indices = [
+            rng.choice(np.flatnonzero(y == c), counts.min(), replace=False)
+            for c in classes
+        ]
+        # Sorted positions keep the original row order
+        return np.sort(np.concatenate(indices))
+    raise ValueError(f"Not existing typos: {typos}")
+
+
+def smote_samples(X, y, random_state=42, neighbors="exact", k_neighbors=5):
+    """
+    Synthetic samples balancing every class with the largest one. The original
+    samples are not returned, the oversampled dataset is X, y followed by them.
+    neighbors: "exact" or "approximate" (ApproximateNeighbors) neighbour search
+    """
+    from imblearn.over_sampling import SMOTE
+
+    if neighbors == "approximate":
+        k_neighbors = ApproximateNeighbors(k_neighbors + 1, random_state)
+    elif neighbors != "exact":
+        raise ValueError(f"Not existing neighbors: {neighbors}")
+    smote = SMOTE(random_state=random_state, k_neighbors=k_neighbors)
+    X_resampled, y_resampled = smote.fit_resample(X, y)
+    # SMOTE appends the synthetic samples after the original ones
+    return X_resampled[len(X) :], y_resampled[len(y) :]
+
+
+def _smote_oversampling(df, tag_name="anyadr", random_state=42, neighbors="exact"):
+    features = df.columns.drop(tag_name)
+    X_new, y_new = smote_samples(
+        df[features].to_numpy(), df[tag_name].to_numpy(), random_state, neighbors
+    )
+    synthetic = pd.DataFrame(X_new, columns=features)
+    synthetic[tag_name] = y_new
+    # Integer columns stay integer, rounded to the nearest value (astype
+    # alone would truncate the interpolated values towards zero)
+    integers = [column for column in features if df[column].dtype.kind in "iu"]
+    synthetic[integers] = synthetic[integers].round()
+    synthetic = synthetic[df.columns].astype(df.dtypes)
+    return pd.concat([df, synthetic], ignore_index=True)
+
+
+def sampling(df, *, tag_name, typos, random_state=42, neighbors="exact"):
     """
     no            : Do nothing
     undersampling : undersample
     smote         : oversampling
+    random_state  : seed of the undersampling / SMOTE draws
+    neighbors     : "exact" or "approximate" neighbour search of SMOTE
+    The undersampled rows are copied once; callers selecting rows or columns
+    themselves should take sample_indices and index df once with both.
     """
     if typos == "no":
         return df
 
     if typos == "undersampling":
-        return _undersampling(df, tag_name)
+        return df.iloc[sample_indices(df[tag_name], typos, random_state)]
 
     if typos == "smote":
-        return _smote_oversampling(df, tag_name)
+        return _smote_oversampling(df, tag_name, random_state, neighbors)
 
     raise ValueError(f"Not existing typos: {typos}")
@@ -0,0 +1,180 @@
+"""
+Dependency aware stage scheduler
+
+A pipeline is a list of stages, each one naming the stages whose results it
+takes as keyword arguments. Stages whose dependencies are done run
+concurrently on a process pool, capped at max_workers. Every call is
+instrumented (koan.instrument.measure) and the records are passed to the
+callbacks as the stages finish.
+"""
+
+import os
+import time
+import multiprocessing
+from typing import Callable, NamedTuple
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from joblib.externals.loky import get_reusable_executor
+from . import threads
+from .instrument import measure
+
+
+class Stage(NamedTuple):
+    """
+    name: unique name of the stage
+    func: module level function (it is pickled to the worker processes)
+    args, kwargs: fixed arguments of func (no keyword arguments if None)
+    deps: {keyword argument of func: name of the stage providing it}, or
+          (stage name, key) to pass one item of a stage returning a dict
+          (no dependencies if None)
+    """
+
+    name: str
+    func: Callable
+    args: tuple = ()
+    kwargs: dict = None
+    deps: dict = None
+
+
+# Barrier of the pool workers, see _release_worker
+_barrier = None
+
+
+def _init_worker(n_threads, barrier):
+    global _barrier
+    threads.set_budget(n_threads)
+    _barrier = barrier
+
+
+def _release_worker():
+    """
+    Shut down the loky workers of this pool worker, once every pool worker
+    runs this task (so that each one gets exactly one of them)
+    """
+    _barrier.wait()
+    get_reusable_executor().shutdown(wait=True)
+
+
+def _dep_names(stage):
+    return {
+        dep[0] if isinstance(dep, tuple) else dep for dep in (stage.deps or {}).values()
+    }
+
+
+def _dep_value(results, dep):
+    if isinstance(dep, tuple):
+        name, key = dep
+        return results[name][key]
+    return results[dep]
+
+
+def _stage_call(stage, results):
+    kwargs = {
+        **(stage.kwargs or {}),
+        **{arg: _dep_value(results, dep) for arg, dep in (stage.deps or {}).items()},
+    }
+    return stage.func, stage.args, kwargs
+
+
+def run_stages(
+    stages, max_workers=None, callbacks=(), profile_dir=None, n_threads=None
+):
+    """
+    Run the stages in dependency order, at most max_workers at a time
+    (all cores when None, in this process without a pool when 1).
+    n_threads: thread budget of the run (koan.threads, the current one when
+               None), split evenly between the worker processes
+    callbacks: functions called with the record of each finished stage,
+               e.g. to forward the metrics to a monitoring system
+    profile_dir: directory of per stage cProfile dumps (no profiling if None)
+    Returns ({stage name: result}, timeline), the timeline being one
+    {"stage", "start", "end", "duration", "cpu", "peak_rss_mb", "pid",
+    "inputs", "output", "threads"} record per stage (see measure), with
+    times in seconds since the start of the run. The record of a stage
+    queueing a figure on a RenderQueue (returning its future) is the one of
+    the rendering, filled in and passed to the callbacks once it is drawn.
+    """
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        missing = _dep_names(stage) - names
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on unknown {missing}")
+
+    results = {}
+    timeline = []
+    t0 = time.time()
+
+    def update(entry, metrics):
+        entry.update(metrics, start=metrics["start"] - t0, end=metrics["end"] - t0)
+        for callback in callbacks:
+            callback(entry)
+
+    def record(stage, result, metrics):
+        results[stage.name] = result
+        entry = {"stage": stage.name}
+        timeline.append(entry)
+        if not isinstance(result, Future):
+            update(entry, metrics)
+            return
+        # Timing the submission says nothing, the render worker measures
+        entry.update(metrics, start=None, end=None, duration=None)
+
+        def rendered(future):
+            if future.exception() is None:
+                update(entry, future.result()[1])
+
+        result.add_done_callback(rendered)
+
+    pending = list(stages)
+    n_threads = n_threads or threads.available()
+    if max_workers == 1:
+        with threads.budget(n_threads):
+            while pending:
+                ready = [s for s in pending if _dep_names(s) <= results.keys()]
+                if not ready:
+                    raise ValueError("Stages have circular dependencies")
+                for stage in ready:
+                    call = _stage_call(stage, results)
+                    record(stage, *measure(*call, stage.name, profile_dir))
+                    pending.remove(stage)
+        return results, timeline
+
+    running = {}
+    max_workers = max(1, min(max_workers or os.cpu_count(), len(stages)))
+    # The loky workers of joblib stages are reused by the following stages
+    # of a pool worker (no restart, numba keeps its compiled code) and shut
+    # down at the end, they would otherwise idle for minutes and hold up the
+    # exit of the pool worker
+    barrier = multiprocessing.Barrier(max_workers)
+    executor = ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(threads.share(max_workers, n_threads), barrier),
+    )
+    with executor:
+        try:
+            while pending or running:
+                ready = [s for s in pending if _dep_names(s) <= results.keys()]
+                if not ready and not running:
+                    raise ValueError("Stages have circular dependencies")
+                for stage in ready:
+                    future = executor.submit(
+                        measure, *_stage_call(stage, results), stage.name, profile_dir
+                    )
+                    running[future] = stage
+                    pending.remove(stage)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record(running.pop(future), *future.result())
+        finally:
+            # Also after a failed stage, the pool would otherwise wait on idle
+            # loky workers before it exits
+            try:
+                releases = [
+                    executor.submit(_release_worker) for _ in range(max_workers)
+                ]
+            except BrokenProcessPool:
+                releases = []
+        for future in releases:
+            future.result()
+    return results, timeline
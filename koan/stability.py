@@ -0,0 +1,131 @@
+"""
+Bootstrap stability of the Borda ranking
+
+The three boosters are refitted on random draws of the rows (bootstrap or
+subsample) in parallel, each draw giving a Borda consensus ranking. The
+rankings are folded into a (feature x rank) histogram as the draws finish,
+so memory does not grow with the number of draws, and the draws stop early
+once the consensus top k has kept the same order for a number of draws.
+"""
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from . import borda_functions as bdf
+from . import threads
+from .borda_importance import fit_boosters
+from .voters import voter_importances
+
+
+def _draw_ranks(X, y, rows, n_threads, random_state, voters=("native",)):
+    """Consensus rank (0 = most important) of every feature on X[rows]"""
+    X, y = X[rows], y[rows]
+    models, _ = fit_boosters(X, y, n_threads, random_state)
+    importances, _ = voter_importances(models, X, y, voters, n_jobs=n_threads)
+    scores = bdf.borda_scores(bdf.importance_points(importances))
+    ranks = np.empty(len(scores), dtype=np.int64)
+    # Stable sort, ties keep the column order
+    ranks[np.argsort(-scores, kind="stable")] = np.arange(len(scores))
+    return ranks
+
+
+def _draws(y, n_draws, method, fraction, rng):
+    """Row positions of each draw, stratified on the labels"""
+    classes = [np.flatnonzero(y == c) for c in np.unique(y)]
+    for _ in range(n_draws):
+        if method == "bootstrap":
+            rows = [rng.choice(idx, len(idx), replace=True) for idx in classes]
+        elif method == "subsample":
+            rows = [
+                rng.choice(idx, max(1, int(fraction * len(idx))), replace=False)
+                for idx in classes
+            ]
+        else:
+            raise ValueError(f"Not existing method: {method}")
+        yield np.sort(np.concatenate(rows)), int(rng.integers(2**31 - 1))
+
+
+def _rank_quantile(cumulative, q):
+    # First rank whose cumulative share reaches q, 1 based
+    return np.argmax(cumulative >= q - 1e-12, axis=1) + 1
+
+
+def stability_selection(
+    df,
+    tagname,
+    n_draws=100,
+    method="subsample",
+    fraction=0.5,
+    top_k=10,
+    patience=10,
+    min_draws=20,
+    confidence=0.9,
+    n_jobs=None,
+    random_state=0,
+    voters=("native",),
+):
+    """
+    n_draws: maximum number of draws
+    method: "bootstrap" (n rows with replacement) or "subsample" (fraction
+            of the rows without replacement), stratified on the tag
+    top_k: size of the consensus top k whose selection frequency is reported
+           and whose order is checked for convergence
+    patience, min_draws: stop once at least min_draws draws are done and the
+                         top k order has not changed for patience draws
+    confidence: level of the rank intervals
+    n_jobs: draws fitted concurrently, each with its share of the thread
+            budget (as many as the budget when None)
+    voters: importances the boosters vote with, as in borda_importance_scores
+            (the draws rank the features the way the consensus does)
+    Returns a DataFrame sorted by mean rank: Feature, mean_rank, rank_low,
+    rank_high (ranks are 1 based), selection_frequency (share of the draws
+    ranking the feature in the top k); the number of draws done is in
+    .attrs["n_draws"].
+    """
+    features = [column for column in df.columns if column != tagname]
+    X = df[features].to_numpy(dtype=np.float32)
+    y = df[tagname].to_numpy()
+    n_features = len(features)
+    top_k = min(top_k, n_features)
+    n_jobs = n_jobs or min(n_draws, threads.available())
+    n_threads = threads.share(n_jobs)
+    rng = np.random.default_rng(random_state)
+
+    # histogram[feature, rank]: number of draws ranking feature at rank
+    histogram = np.zeros((n_features, n_features), dtype=np.int64)
+    positions = np.arange(n_features)
+    n_done, stable, top = 0, 0, None
+    parallel = Parallel(
+        n_jobs=n_jobs, return_as="generator_unordered", max_nbytes="1M", mmap_mode="r"
+    )
+    with threads.budget(n_threads):
+        draws = parallel(
+            delayed(_draw_ranks)(X, y, rows, n_threads, seed, voters)
+            for rows, seed in _draws(y, n_draws, method, fraction, rng)
+        )
+        for ranks in draws:
+            histogram[positions, ranks] += 1
+            n_done += 1
+            mean_rank = histogram @ positions / n_done
+            new_top = np.argsort(mean_rank, kind="stable")[:top_k]
+            same = top is not None and np.array_equal(new_top, top)
+            stable, top = (stable + 1 if same else 0), new_top
+            if n_done >= min_draws and stable >= patience:
+                # Closing the generator cancels the draws not started yet
+                draws.close()
+                break
+
+    cumulative = histogram.cumsum(axis=1) / n_done
+    alpha = (1 - confidence) / 2
+    result = pd.DataFrame(
+        {
+            "Feature": features,
+            "mean_rank": histogram @ positions / n_done + 1,
+            "rank_low": _rank_quantile(cumulative, alpha),
+            "rank_high": _rank_quantile(cumulative, 1 - alpha),
+            "selection_frequency": histogram[:, :top_k].sum(axis=1) / n_done,
+        }
+    )
+    result = result.sort_values("mean_rank", kind="stable", ignore_index=True)
+    result.attrs["n_draws"] = n_done
+    return result
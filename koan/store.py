@@ -0,0 +1,221 @@
+"""
+Columnar store of the numeric results
+
+Every run appends the plot ready outputs of its stages (cross validation
+scores, Borda rankings and their bootstrap stability, PyCaret leaderboards,
+embedding coordinates, correlation matrices) to Parquet tables, one file per
+stage under <root>/<table>/run=<run>/, each row keyed by run, stage, target,
+sampling and classifier. The figures can be rebuilt from the store and runs
+compared without recomputing anything (koan.replot).
+"""
+
+import os
+import re
+import json
+import datetime
+import numpy as np
+import pandas as pd
+
+KEYS = ["run", "stage", "target", "sampling", "classifier"]
+RUNS = "runs"
+
+
+def new_run_id():
+    """Run id from the current time, sortable by date"""
+    return datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+
+
+def cross_val_table(cross_val_data):
+    """
+    One row per (score, prefix size, fold) of a cross_val_exp result,
+    recommended flags the rows of the recommended prefix of an adaptive search
+    """
+    recommended = cross_val_data.get("recommended") or {}
+    rows = []
+    for score_name, results in cross_val_data["scores"].items():
+        sizes = cross_val_data.get("n_features", range(1, len(results) + 1))
+        for k, folds in zip(sizes, results):
+            flag = score_name == recommended.get("metric") and k == recommended.get(
+                "n_features"
+            )
+            for fold, value in enumerate(folds):
+                rows.append((score_name, k, fold, float(value), flag))
+    return pd.DataFrame(
+        rows, columns=["score", "n_features", "fold", "value", "recommended"]
+    )
+
+
+def cross_val_from_table(table):
+    """cross_val_exp result of the cross_val rows of one stage"""
+    table = table.sort_values(["n_features", "fold"], kind="stable")
+    scores, sizes = {}, None
+    for score_name, group in table.groupby("score", sort=False):
+        by_size = group.groupby("n_features")["value"]
+        sizes = list(by_size.groups)
+        scores[score_name] = [by_size.get_group(k).to_numpy() for k in sizes]
+    result = {"classifier_name": table["classifier"].iloc[0], "scores": scores}
+    # Only some prefixes were evaluated (adaptive search)
+    if sizes is not None and sizes != list(range(1, len(sizes) + 1)):
+        result["n_features"] = sizes
+    if "recommended" in table and table["recommended"].fillna(False).any():
+        row = table[table["recommended"].fillna(False).astype(bool)].iloc[0]
+        result["recommended"] = {
+            "n_features": int(row["n_features"]),
+            "metric": row["score"],
+        }
+    return result
+
+
+def borda_table(borda_results):
+    return borda_results.assign(position=np.arange(len(borda_results)))
+
+
+def borda_from_table(table):
+    table = table.sort_values("position")
+    return table[["Feature", "Borda Rank"]].reset_index(drop=True)
+
+
+def stability_table(stability):
+    return stability.assign(n_draws=stability.attrs.get("n_draws"))
+
+
+def stability_from_table(table):
+    """stability_selection result of the stability rows of one stage"""
+    columns = ["Feature", "mean_rank", "rank_low", "rank_high", "selection_frequency"]
+    stability = table.sort_values("mean_rank", kind="stable")[columns]
+    stability = stability.reset_index(drop=True)
+    stability.attrs["n_draws"] = int(table["n_draws"].iloc[0])
+    return stability
+
+
+def leaderboard_table(leaderboard):
+    return leaderboard.rename_axis("model_id").reset_index()
+
+
+def embeddings_table(embeddings):
+    """One row per (method, embedded point), z is NaN for the 2D embeddings"""
+    frames = []
+    for title, coordinates in embeddings.items():
+        if title in ("labels", "rows"):
+            continue
+        frame = pd.DataFrame(
+            {
+                "method": title,
+                "point": np.arange(len(coordinates)),
+                "x": coordinates[:, 0],
+                "y": coordinates[:, 1],
+                "z": coordinates[:, 2] if coordinates.shape[1] > 2 else np.nan,
+            }
+        )
+        if embeddings["labels"] is not None:
+            frame["label"] = embeddings["labels"]
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def embeddings_from_table(table):
+    """compute_embeddings result (without "rows") of an embeddings table"""
+    embeddings, labels = {"rows": None}, None
+    for title, group in table.groupby("method", sort=False):
+        group = group.sort_values("point")
+        columns = ["x", "y", "z"] if title.endswith("3D") else ["x", "y"]
+        embeddings[title] = group[columns].to_numpy()
+        if "label" in group:
+            labels = group["label"].to_numpy()
+    embeddings["labels"] = labels
+    return embeddings
+
+
+def correlation_table(corr_matrix):
+    return corr_matrix.rename_axis("feature").reset_index()
+
+
+def correlation_from_table(table):
+    # Tables of several stages share the file columns, keep this one's
+    features = list(table["feature"])
+    matrix = table.set_index("feature")[features].astype(np.float32)
+    matrix.index.name = None
+    return matrix
+
+
+TABLES = {
+    "cross_val": cross_val_table,
+    "borda": borda_table,
+    "stability": stability_table,
+    "leaderboard": leaderboard_table,
+    "embeddings": embeddings_table,
+    "correlation": correlation_table,
+}
+
+
+def _file_name(stage):
+    return re.sub(r"[^\w.-]", "_", stage) + ".parquet"
+
+
+def store_results(
+    data, root, table, run, stage, target=None, sampling=None, classifier=None
+):
+    """
+    Append a stage output to the store as one Parquet file
+    data: stage output, converted by TABLES[table]
+    run, stage, target, sampling, classifier: key columns of its rows
+    Returns the path written.
+    """
+    if table not in TABLES:
+        raise ValueError(f"Not existing table: {table}")
+    frame = TABLES[table](data)
+    keys = dict(
+        run=run, stage=stage, target=target, sampling=sampling, classifier=classifier
+    )
+    frame = pd.concat(
+        [pd.DataFrame(keys, index=frame.index, dtype=object), frame], axis=1
+    )
+    directory = os.path.join(root, table, f"run={run}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, _file_name(stage))
+    frame.to_parquet(path, index=False)
+    return path
+
+
+def store_run(root, run, **run_info):
+    """Record a run and its options (json) in the runs table"""
+    directory = os.path.join(root, RUNS, f"run={run}")
+    os.makedirs(directory, exist_ok=True)
+    frame = pd.DataFrame(
+        {
+            "run": [run],
+            "created": [datetime.datetime.now().isoformat(timespec="seconds")],
+            "options": [json.dumps(run_info, default=str)],
+        }
+    )
+    frame.to_parquet(os.path.join(directory, "run.parquet"), index=False)
+
+
+def runs(root):
+    """Runs of the store, oldest first"""
+    directory = os.path.join(root, RUNS)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[len("run=") :] for name in os.listdir(directory))
+
+
+def run_options(root, run):
+    """Options recorded by store_run"""
+    path = os.path.join(root, RUNS, f"run={run}", "run.parquet")
+    return json.loads(pd.read_parquet(path)["options"].iloc[0])
+
+
+def read_table(root, table, run_ids=None):
+    """Rows of a table, of the given runs (all of them if None)"""
+    directory = os.path.join(root, table)
+    if not os.path.isdir(directory):
+        return pd.DataFrame(columns=KEYS)
+    frames = [
+        pd.read_parquet(os.path.join(directory, run_dir, name))
+        for run_dir in sorted(os.listdir(directory))
+        if run_ids is None or run_dir[len("run=") :] in run_ids
+        for name in sorted(os.listdir(os.path.join(directory, run_dir)))
+    ]
+    if not frames:
+        return pd.DataFrame(columns=KEYS)
+    return pd.concat(frames, ignore_index=True)
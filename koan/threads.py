@@ -0,0 +1,78 @@
+"""
+Thread budget
+
+The boosters, PyCaret, UMAP's numba and the BLAS behind PCA / LDA all
+default to one thread per core, which oversubscribes the machine as soon as
+stages or folds run concurrently. koan keeps one budget instead: the number
+of threads the current process may use, in KOAN_NUM_THREADS (all cores when
+unset). Whoever starts concurrent work splits the budget between the
+workers, and each worker gets its share as its own budget. The share is
+also exported to the native libraries: the *_NUM_THREADS variables, read by
+the processes started afterwards, and threadpoolctl limits on the thread
+pools already loaded.
+"""
+
+import os
+from contextlib import contextmanager
+from threadpoolctl import threadpool_limits
+
+ENV = "KOAN_NUM_THREADS"
+NATIVE_ENV = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMBA_NUM_THREADS",
+]
+# threadpoolctl limits set by set_budget, kept alive so that they hold
+_limits = None
+
+
+def available():
+    """Threads the current process may use"""
+    return int(os.environ.get(ENV, 0)) or os.cpu_count()
+
+
+def split(n_threads, n_parts):
+    """Split a thread budget into n_parts shares of at least one thread"""
+    return [
+        max(1, n_threads // n_parts + (i < n_threads % n_parts)) for i in range(n_parts)
+    ]
+
+
+def share(n_workers, n_threads=None):
+    """Threads of each of n_workers concurrent workers, at least one"""
+    return max(1, (n_threads or available()) // n_workers)
+
+
+def set_budget(n_threads):
+    """Make n_threads the budget of this process and of the ones it starts"""
+    global _limits
+    for name in [ENV, *NATIVE_ENV]:
+        os.environ[name] = str(n_threads)
+    _limits = threadpool_limits(n_threads)
+
+
+@contextmanager
+def budget(n_threads):
+    """set_budget for the duration of the block"""
+    global _limits
+    saved_env = {name: os.environ.get(name) for name in [ENV, *NATIVE_ENV]}
+    saved_limits = _limits
+    set_budget(n_threads)
+    try:
+        yield n_threads
+    finally:
+        _limits.restore_original_limits()
+        _limits = saved_limits
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def numba_threads(n_threads):
+    """Limit numba's parallel regions (UMAP) to n_threads, numba being loaded"""
+    import numba
+
+    numba.set_num_threads(min(n_threads, numba.config.NUMBA_NUM_THREADS))
@@ -0,0 +1,130 @@
+"""
+Importance voters of the Borda consensus
+
+Besides the built-in feature_importances_ of the boosters (gain / split
+counts, the latter biased towards high cardinality features), a fitted
+booster can vote with
+shap        : mean |SHAP value|, from the boosters' native TreeSHAP computed
+              in row batches on a capped sample of the rows
+permutation : mean drop of ROC-AUC when a column is permuted, the columns
+              being permuted in place on per-thread copies of the sample
+Both are computed on the training rows.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from sklearn.metrics import roc_auc_score
+from sklearn.utils import resample
+from . import threads
+
+VOTERS = ("native", "shap", "permutation")
+# predict_proba options keeping each concurrent permutation on one thread
+_ONE_THREAD = {"CatBoost": {"thread_count": 1}, "LightGBM": {"num_threads": 1}}
+
+
+def sample_rows(X, y, max_rows=2000, random_state=0):
+    """At most max_rows rows of X, y, stratified on y"""
+    if len(X) <= max_rows:
+        return X, y
+    rows = resample(
+        np.arange(len(X)),
+        replace=False,
+        n_samples=max_rows,
+        stratify=y,
+        random_state=random_state,
+    )
+    return X[rows], y[rows]
+
+
+def _contributions(name, model, X):
+    """(rows x features) SHAP values of a booster, bias column dropped"""
+    if name == "XgBoost":
+        from xgboost import DMatrix
+
+        contribs = model.get_booster().predict(DMatrix(X), pred_contribs=True)
+    elif name == "CatBoost":
+        from catboost import Pool
+
+        contribs = model.get_feature_importance(Pool(X), type="ShapValues")
+    elif name == "LightGBM":
+        contribs = model.predict(X, pred_contrib=True)
+    else:
+        raise ValueError(f"Not existing booster: {name}")
+    return contribs[:, :-1]
+
+
+def shap_importances(models, X, batch_size=512):
+    """(boosters x features) mean |SHAP value| over the rows of X"""
+    importances = np.zeros((len(models), X.shape[1]))
+    for i, (name, model) in enumerate(models.items()):
+        for start in range(0, len(X), batch_size):
+            batch = X[start : start + batch_size]
+            importances[i] += np.abs(_contributions(name, model, batch)).sum(axis=0)
+    return importances / len(X)
+
+
+def permutation_importances(models, X, y, n_repeats=5, n_jobs=None, random_state=0):
+    """
+    (boosters x features) mean drop of ROC-AUC over n_repeats permutations
+    of each column
+    n_jobs: concurrent (booster, column) tasks, one thread each (the thread
+            budget when None); the boosters are set to predict on one thread
+    """
+    for name, model in models.items():
+        if name == "XgBoost":
+            model.set_params(n_jobs=1)
+    local = threading.local()
+
+    def proba(name, model, X):
+        return model.predict_proba(X, **_ONE_THREAD.get(name, {}))[:, 1]
+
+    baselines = {
+        name: roc_auc_score(y, proba(name, model, X)) for name, model in models.items()
+    }
+
+    def column_drop(name, j, seed):
+        # One copy of X per thread, a column is permuted in place and restored
+        if not hasattr(local, "X"):
+            local.X = X.copy()
+        X_perm, rng = local.X, np.random.default_rng(seed)
+        original = X_perm[:, j].copy()
+        drops = []
+        for _ in range(n_repeats):
+            X_perm[:, j] = rng.permutation(original)
+            drops.append(
+                baselines[name] - roc_auc_score(y, proba(name, models[name], X_perm))
+            )
+        X_perm[:, j] = original
+        return np.mean(drops)
+
+    tasks = [(name, j) for name in models for j in range(X.shape[1])]
+    seeds = np.random.default_rng(random_state).integers(2**31 - 1, size=len(tasks))
+    with ThreadPoolExecutor(max_workers=n_jobs or threads.available()) as executor:
+        drops = list(executor.map(column_drop, *zip(*tasks), seeds))
+    return np.asarray(drops).reshape(len(models), X.shape[1])
+
+
+def voter_importances(models, X, y, voters=("native",), max_rows=2000, n_jobs=None):
+    """
+    (voters x features) importance matrix, one row per booster and voter,
+    and the matching row labels "<booster> <voter>"
+    """
+    unknown = set(voters) - set(VOTERS)
+    if unknown:
+        raise ValueError(f"Not existing voters: {unknown}")
+    rows, labels = [], []
+    if "native" in voters:
+        rows.append(
+            np.vstack([model.feature_importances_ for model in models.values()])
+        )
+        labels += [f"{name} native" for name in models]
+    if "shap" in voters or "permutation" in voters:
+        X_sample, y_sample = sample_rows(X, y, max_rows)
+    if "shap" in voters:
+        rows.append(shap_importances(models, X_sample))
+        labels += [f"{name} shap" for name in models]
+    if "permutation" in voters:
+        rows.append(permutation_importances(models, X_sample, y_sample, n_jobs=n_jobs))
+        labels += [f"{name} permutation" for name in models]
+    return np.vstack(rows), labels
@@ -1,11 +1,327 @@
 import warnings
 
-warnings.filterwarnings("ignore")
-from . import plotting as plo
+# Silence the noise of the modelling libraries; DeprecationWarning keeps the
+# Python defaults, so the deprecations of the koan API are still shown
+for category in (UserWarning, FutureWarning, RuntimeWarning):
+    warnings.filterwarnings("ignore", category=category)
+from functools import partial
+from .correlation import correlation_matrix
+from .embeddings import compute_embeddings
+from .cache import StageCache, cached, file_digest, stage_key
+from .instrument import write_manifest
 from .preprocess import preprocess
 from .pycaret import exec_pycaret
-from .borda_importance import borda_importance
-from .cross_validation import cross_val_exp
+from .borda_importance import borda_importance_scores
+from .cross_validation import adaptive_cross_val_exp, cross_val_exp
+from .render import RenderQueue, render
+from .scheduler import Stage, run_stages
+from .store import new_run_id, store_results, store_run
+from .utilities import create_save_path
+
+
+def _cached_stage(cache, stage, key, func, **kwargs):
+    return cached(cache, stage, key, partial(func, **kwargs))
+
+
+def _plot_stage(name, plot, deps, render_queue, dpi, fmt, **kwargs):
+    """Stage drawing koan.plotting.<plot>, queued on render_queue if given"""
+    if render_queue is not None:
+        return Stage(name, render_queue.submit, (plot,), kwargs, deps)
+    return Stage(name, render, (plot, dpi, fmt), kwargs, deps)
+
+
+def _store_stage(table, dep, store_kwargs, **keys):
+    """
+    Stage appending the output of the stage dep (a stage name or a
+    (stage, key) pair) to the results store
+    store_kwargs: root and run of the store, target of the rows
+    keys: sampling and classifier of the rows
+    """
+    source = dep if isinstance(dep, str) else dep[0]
+    return Stage(
+        f"{source}/store/{table}",
+        store_results,
+        kwargs={"table": table, "stage": source, **store_kwargs, **keys},
+        deps={"data": dep},
+    )
+
+
+def model_stages(
+    name,
+    df_stage,
+    cache,
+    data_key,
+    *,
+    tagname,
+    sampling_method,
+    results_path,
+    classifiers,
+    n_jobs=1,
+    search="full",
+    pycaret_options=None,
+    stability_options=None,
+    fold_options=None,
+    voters=("native",),
+    plot_kwargs=None,
+    store_kwargs=None,
+):
+    """
+    The PyCaret, Borda importance and cross validation stages (with their
+    figures) of the dataset computed by the stage df_stage
+    name: function of the stage name giving the scheduler stage name
+    data_key: stage_key of that dataset, the cache keys derive from it
+    plot_kwargs: render_queue, dpi and fmt of the plotting stages (no queue,
+                 600 dpi png by default)
+    store_kwargs: root, run and target of the results store the outputs are
+                  appended to (not stored if None)
+    Other arguments as in workflow.
+    """
+    plot_kwargs = {
+        "render_queue": None,
+        "dpi": 600,
+        "fmt": "png",
+        **(plot_kwargs or {}),
+    }
+
+    # The cross validation keys derive from the Borda one: the ranking, the
+    # voters and the fold plan all change what is cross validated
+    bordas_key = stage_key(data_key, stability_options, voters, fold_options)
+
+    def plot_stage(stage, plot, deps, **kwargs):
+        kwargs.update(sampling_type=sampling_method, results_path=results_path)
+        return _plot_stage(name(stage), plot, deps, **plot_kwargs, **kwargs)
+
+    stages = [
+        Stage(
+            name("pycaret"),
+            exec_pycaret,
+            kwargs={
+                "tag_name": tagname,
+                "sampling_type": sampling_method,
+                "result_path": results_path,
+                "cache": cache,
+                "data_key": data_key,
+                **(pycaret_options or {}),
+            },
+            deps={"df": df_stage},
+        ),
+        # {"borda_importance": borda_results, "data": Dataset, "feature_list": ...}
+        Stage(
+            name("borda_importance"),
+            _cached_stage,
+            (
+                cache,
+                "bordas",
+                bordas_key,
+                borda_importance_scores,
+            ),
+            {
+                "tagname": tagname,
+                "stability": stability_options,
+                "voters": voters,
+                "folds": fold_options,
+            },
+            {"df": df_stage},
+        ),
+        plot_stage(
+            "plot_borda_importance",
+            "plot_borda_importance",
+            {"borda_results": (name("borda_importance"), "borda_importance")},
+        ),
+    ]
+    if stability_options is not None:
+        stages.append(
+            plot_stage(
+                "plot_stability",
+                "plot_stability",
+                {"stability": (name("borda_importance"), "stability")},
+            )
+        )
+    if store_kwargs is not None:
+        stages += [
+            _store_stage(
+                "leaderboard", name("pycaret"), store_kwargs, sampling=sampling_method
+            ),
+            _store_stage(
+                "borda",
+                (name("borda_importance"), "borda_importance"),
+                store_kwargs,
+                sampling=sampling_method,
+            ),
+        ]
+        if stability_options is not None:
+            stages.append(
+                _store_stage(
+                    "stability",
+                    (name("borda_importance"), "stability"),
+                    store_kwargs,
+                    sampling=sampling_method,
+                )
+            )
+
+    cross_val = adaptive_cross_val_exp if search == "adaptive" else cross_val_exp
+    for classifier_name, classifier in classifiers.items():
+        stages += [
+            Stage(
+                name(f"cross_val_exp/{classifier_name}"),
+                _cached_stage,
+                (
+                    cache,
+                    "cross_val_exp",
+                    stage_key(bordas_key, classifier_name, classifier, search),
+                    cross_val,
+                ),
+                {
+                    "classifier_name": classifier_name,
+                    "classifier": classifier,
+                    "n_jobs": n_jobs,
+                },
+                {"bordas": name("borda_importance")},
+            ),
+            plot_stage(
+                f"plot_boxplot_metrics/{classifier_name}",
+                "plot_boxplot_metrics",
+                {"cross_val_data": name(f"cross_val_exp/{classifier_name}")},
+            ),
+        ]
+        if store_kwargs is not None:
+            stages.append(
+                _store_stage(
+                    "cross_val",
+                    name(f"cross_val_exp/{classifier_name}"),
+                    store_kwargs,
+                    sampling=sampling_method,
+                    classifier=classifier_name,
+                )
+            )
+    return stages
+
+
+def workflow_stages(
+    *,
+    csvfile,
+    tagname,
+    sampling_method,
+    tag_vals,
+    results_path,
+    int_columns,
+    classifiers,
+    n_jobs=1,
+    search="full",
+    cache_dir=None,
+    ingest_dir=None,
+    dpi=600,
+    fmt="png",
+    render_queue=None,
+    pycaret_options=None,
+    stability_options=None,
+    fold_options=None,
+    voters=("native",),
+    random_state=42,
+    store_dir=None,
+    run_id=None,
+):
+    """
+    The workflow as a list of scheduler stages, named "<sampling_method>/<stage>"
+    so that the stages of several sampling methods can be run together.
+    render_queue: RenderQueue the plotting stages hand their data to (the
+                  stages must then run in this process, max_workers=1),
+                  otherwise the plotting stages render themselves
+    run_id: run the outputs are stored under in store_dir
+    Other arguments as in workflow.
+    """
+    cache = StageCache(cache_dir) if cache_dir is not None else None
+    # Every stage key derives from the dataset key, so any change upstream
+    # (file contents, integer columns, sampling) invalidates the stages below
+    data_key = stage_key(
+        file_digest(csvfile), int_columns, tagname, sampling_method, random_state
+    )
+
+    def name(stage):
+        return f"{sampling_method}/{stage}"
+
+    plot_kwargs = {"render_queue": render_queue, "dpi": dpi, "fmt": fmt}
+    store_kwargs = None
+    if store_dir is not None:
+        store_kwargs = {"root": store_dir, "run": run_id, "target": None}
+
+    def plot_stage(stage, plot, deps, **kwargs):
+        kwargs.update(sampling_type=sampling_method, results_path=results_path)
+        return _plot_stage(name(stage), plot, deps, **plot_kwargs, **kwargs)
+
+    stages = [
+        Stage(
+            name("preprocess"),
+            _cached_stage,
+            (cache, "preprocess", data_key, preprocess),
+            {
+                "csvfile": csvfile,
+                "int_columns": int_columns,
+                "tagname": tagname,
+                "sampling_method": sampling_method,
+                "ingest_dir": ingest_dir,
+                "random_state": random_state,
+            },
+        ),
+        Stage(
+            name("embeddings"),
+            _cached_stage,
+            (cache, "embeddings", data_key, compute_embeddings),
+            {"tagname": tagname},
+            {"df": name("preprocess")},
+        ),
+        plot_stage(
+            "plot_dimensionality_reduction",
+            "plot_dimensionality_reduction",
+            {"embeddings": name("embeddings")},
+            df=None,
+            tag_vals=tag_vals,
+            tagname=tagname,
+        ),
+        Stage(
+            name("correlation"),
+            _cached_stage,
+            (cache, "correlation", data_key, correlation_matrix),
+            deps={"df": name("preprocess")},
+        ),
+        plot_stage(
+            "plot_correlation_heatmap",
+            "plot_correlation_heatmap",
+            {"corr_matrix": name("correlation")},
+            df=None,
+        ),
+    ]
+    if store_kwargs is not None:
+        stages += [
+            _store_stage(
+                "embeddings", name("embeddings"), store_kwargs, sampling=sampling_method
+            ),
+            _store_stage(
+                "correlation",
+                name("correlation"),
+                store_kwargs,
+                sampling=sampling_method,
+            ),
+        ]
+    stages += model_stages(
+        name,
+        name("preprocess"),
+        cache,
+        data_key,
+        tagname=tagname,
+        sampling_method=sampling_method,
+        results_path=results_path,
+        classifiers=classifiers,
+        n_jobs=n_jobs,
+        search=search,
+        pycaret_options=pycaret_options,
+        stability_options=stability_options,
+        fold_options=fold_options,
+        voters=voters,
+        plot_kwargs=plot_kwargs,
+        store_kwargs=store_kwargs,
+    )
+    return stages
 
 
 def workflow(
@@ -16,7 +332,25 @@ def workflow(
     tag_vals,
     results_path,
     int_columns,
-    classifiers
+    classifiers,
+    n_jobs=1,
+    search="full",
+    cache_dir=None,
+    ingest_dir=None,
+    max_workers=1,
+    dpi=600,
+    fmt="png",
+    background_render=False,
+    pycaret_options=None,
+    stability_options=None,
+    fold_options=None,
+    voters=("native",),
+    random_state=42,
+    store_dir=None,
+    run_id=None,
+    callbacks=(),
+    profile_dir=None,
+    n_threads=None,
 ):
     """
     csvfile: csv file containing dataset
@@ -24,21 +358,76 @@ def workflow(
     sampling_method: can take one of the values ["no", "undersampling", "smote"]
     tag_vals: dictionary of type {0.0: "No", 1.0: "Yes"}
     results_path: root path to save results (data and images)
+    n_jobs: workers used for the cross validation (prefix x fold) grid
+    search: "full" to cross validate every Borda prefix, "adaptive" to
+            search the number of features with adaptive_cross_val_exp
+    cache_dir: directory of a StageCache; the preprocessing, embeddings,
+               correlation matrix, PyCaret leaderboard, Borda importance and
+               cross validation results are persisted there and reused when their inputs
+               have not changed (no cache if None)
+    ingest_dir: directory of the memory-mapped columnar copies of the csv
+    max_workers: independent stages run concurrently on that many processes
+    dpi, fmt: resolution and file format of the saved figures
+    background_render: with max_workers=1, render the figures in a
+                       background RenderQueue process (a script calling
+                       workflow then needs an if __name__ == "__main__" guard)
+    pycaret_options: exec_pycaret budget options, e.g.
+                     {"include": ["lr", "rf"], "fold": 5, "budget_time": 10}
+    stability_options: koan.stability.stability_selection options, e.g.
+                       {"n_draws": 100}, to add the bootstrap stability of
+                       the Borda ranking to its results (not run if None)
+    fold_options: koan.folds.fold_plan options, e.g. {"n_splits": 5}; the
+                  folds are drawn once and shared by every classifier
+                  (seeded, stratified, 10 folds when None)
+    voters: importances the boosters vote with in the Borda consensus,
+            among "native", "shap" and "permutation"
+    random_state: seed of the resampling, part of every cache key
+    store_dir: directory of the results store (koan.store) the numeric
+               outputs are appended to, for koan.replot (no store if None)
+    run_id: id of the run in the store (its start time if None)
+    callbacks, profile_dir: stage metric callbacks and cProfile directory
+                            of run_stages
+    n_threads: thread budget shared by all the stages (all cores when None)
+    The stage records are written to manifest.json next to the figures.
+    Returns the stage timeline of run_stages.
     """
-
-    df = preprocess(
-        csvfile,
-        int_columns,
+    stage_kwargs = dict(
+        csvfile=csvfile,
         tagname=tagname,
         sampling_method=sampling_method,
+        tag_vals=tag_vals,
+        results_path=results_path,
+        int_columns=int_columns,
+        classifiers=classifiers,
+        n_jobs=n_jobs,
+        search=search,
+        cache_dir=cache_dir,
+        ingest_dir=ingest_dir,
+        dpi=dpi,
+        fmt=fmt,
+        pycaret_options=pycaret_options,
+        stability_options=stability_options,
+        fold_options=fold_options,
+        voters=voters,
+        random_state=random_state,
+        store_dir=store_dir,
+        run_id=run_id,
     )
-    plo.plot_dimensionality_reduction(df, tag_vals, sampling_method, results_path)
-    plo.plot_correlation_heatmap(df, sampling_method, results_path)
-    exec_pycaret(df, tagname, sampling_method, results_path)
-    # {"borda_importance": borda_results, "tag": tag, "df": df}
-    borda_results = borda_importance(df, tagname, sampling_method, results_path)
-    for classifier_name, classifier in classifiers.items():
-        cross_res = cross_val_exp(
-            borda_results, classifier_name, classifier, tag_name=tagname
-        )
-        plo.plot_boxplot_metrics(cross_res, sampling_method, results_path)
+    if store_dir is not None:
+        stage_kwargs["run_id"] = run_id = run_id or new_run_id()
+        store_run(store_dir, run_id, **stage_kwargs)
+    run_kwargs = dict(callbacks=callbacks, profile_dir=profile_dir, n_threads=n_threads)
+    if max_workers != 1 or not background_render:
+        stages = workflow_stages(**stage_kwargs)
+        _, timeline = run_stages(stages, max_workers, **run_kwargs)
+    else:
+        with RenderQueue(dpi, fmt) as render_queue:
+            stages = workflow_stages(render_queue=render_queue, **stage_kwargs)
+            _, timeline = run_stages(stages, max_workers=1, **run_kwargs)
+    write_manifest(
+        create_save_path(sampling_method, "manifest.json", results_path),
+        timeline,
+        max_workers=max_workers,
+        **stage_kwargs,
+    )
+    return timeline
@@ -0,0 +1,37 @@
+import numpy as np
+from koan import borda_functions as bdf
+
+
+def test_importance_points_ties_share_average_points():
+    points = bdf.importance_points([[3.0, 1.0, 1.0, 0.5]])
+    np.testing.assert_array_equal(points, [[3.0, 1.5, 1.5, 0.0]])
+
+
+def test_importance_points_unscored_features_get_nothing():
+    points = bdf.importance_points([[2.0, np.nan, 1.0]])
+    np.testing.assert_array_equal(points, [[1.0, 0.0, 0.0]])
+
+
+def test_borda_df_from_importances_sums_points():
+    importances = [[3.0, 2.0, 1.0], [1.0, 2.0, 3.0], [2.0, 2.0, 1.0]]
+    result = bdf.borda_df_from_importances(importances, ["a", "b", "c"])
+    # a: 2 + 0 + 1.5, b: 1 + 1 + 1.5, c: 0 + 2 + 0
+    assert dict(zip(result["Feature"], result["Borda Rank"])) == {
+        "a": 3.5,
+        "b": 3.5,
+        "c": 2.0,
+    }
+    assert result["Feature"].iloc[-1] == "c"
+
+
+def test_borda_df_from_importances_keeps_integer_counts():
+    result = bdf.borda_df_from_importances([[3.0, 2.0, 1.0]], ["a", "b", "c"])
+    assert result["Borda Rank"].dtype.kind == "i"
+    assert list(result["Feature"]) == ["a", "b", "c"]
+
+
+def test_borda_aggregation_sums_rank_list_points():
+    lists = [["a", "b", "c"], ["c", "a"], ["b"]]
+    assert bdf.rank_list(lists[0]) == {"a": 2, "b": 1, "c": 0}
+    # Partial lists give their own points, nothing to the missing features
+    assert bdf.borda_aggregation(lists) == {"a": 2, "b": 1, "c": 1}
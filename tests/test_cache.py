@@ -0,0 +1,36 @@
+import os
+from koan.cache import StageCache, cached, stage_key
+
+
+def test_stage_key_depends_on_every_part():
+    assert stage_key("data", {"a": 1, "b": 2}) == stage_key("data", {"b": 2, "a": 1})
+    assert stage_key("data", 42) != stage_key("data", 43)
+    assert stage_key("data", None) != stage_key("data")
+
+
+def test_cache_computes_once(tmp_path):
+    cache = StageCache(str(tmp_path))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"value": 1}
+
+    assert cache.get_or_compute("stage", "key", compute) == {"value": 1}
+    assert cache.get_or_compute("stage", "key", compute) == {"value": 1}
+    assert len(calls) == 1
+    assert cached(None, "stage", "key", compute) == {"value": 1}
+    assert len(calls) == 2
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    blob = b"x" * 1000
+    cache = StageCache(str(tmp_path), max_bytes=2500)
+    cache.get_or_compute("stage", "a", lambda: blob)
+    cache.get_or_compute("stage", "b", lambda: blob)
+    a, b = (os.path.join(str(tmp_path), f"stage-{key}.pkl") for key in "ab")
+    # a is read last, so b is the least recently used entry
+    os.utime(b, (1, 1))
+    cache.get_or_compute("stage", "a", lambda: blob)
+    cache.get_or_compute("stage", "c", lambda: blob)
+    assert sorted(os.listdir(str(tmp_path))) == ["stage-a.pkl", "stage-c.pkl"]
@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+import pytest
+from koan.correlation import correlation_matrix
+
+
+@pytest.mark.parametrize("method", ["pearson", "spearman"])
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_correlation_matrix_matches_pandas(method, dtype):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(100, 7))
+    X[:, 3] += X[:, 0]
+    df = pd.DataFrame(X.astype(dtype), columns=[f"g{i}" for i in range(7)])
+    corr = correlation_matrix(df, method=method, block_size=3)
+    expected = df.astype(np.float64).corr(method=method)
+    pd.testing.assert_frame_equal(corr, expected, check_dtype=False, atol=1e-5)
+    # df is left as it was
+    np.testing.assert_array_equal(df.to_numpy(), X.astype(dtype))
@@ -0,0 +1,37 @@
+import numpy as np
+from koan.folds import fold_plan, split_block
+
+
+def test_fold_plan_is_a_stratified_partition():
+    y = np.array([0] * 80 + [1] * 20)
+    plan = fold_plan(y, n_splits=10, random_state=3)
+    assert plan.stratified
+    assert plan.n_splits == 10
+    np.testing.assert_array_equal(np.sort(plan.order), np.arange(len(y)))
+    for start, stop in plan.blocks():
+        assert np.bincount(y[plan.order[start:stop]], minlength=2).tolist() == [8, 2]
+
+
+def test_fold_plan_is_seeded():
+    y = np.arange(50) % 2
+    a, b = fold_plan(y, 5, random_state=1), fold_plan(y, 5, random_state=1)
+    np.testing.assert_array_equal(a.order, b.order)
+    c = fold_plan(y, 5, random_state=2)
+    assert not np.array_equal(a.order, c.order)
+
+
+def test_fold_plan_falls_back_to_kfold_on_small_classes():
+    y = np.array([0] * 40 + [1] * 3)
+    plan = fold_plan(y, n_splits=5)
+    assert not plan.stratified
+    np.testing.assert_array_equal(np.sort(plan.order), np.arange(len(y)))
+
+
+def test_split_block():
+    X = np.arange(20, dtype=np.float32).reshape(10, 2)
+    y = np.arange(10)
+    X_train, y_train, X_test, y_test = split_block(X, y, (3, 6), k=1)
+    np.testing.assert_array_equal(y_test, [3, 4, 5])
+    np.testing.assert_array_equal(y_train, [0, 1, 2, 6, 7, 8, 9])
+    assert X_train.shape == (7, 1) and X_test.shape == (3, 1)
+    assert np.shares_memory(X_test, X)
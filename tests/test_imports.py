@@ -0,0 +1,48 @@
+import subprocess
+import sys
+import pytest
+
+# Loaded by the stages that need them, never by importing the entry points
+HEAVY = [
+    "xgboost",
+    "lightgbm",
+    "catboost",
+    "umap",
+    "pycaret",
+    "matplotlib",
+    "seaborn",
+    "imblearn",
+    "shap",
+]
+
+
+def _imported(module):
+    code = (
+        f"import sys, {module}; "
+        f"print(' '.join(m for m in {HEAVY + ['sklearn']!r} if m in sys.modules))"
+    )
+    return subprocess.check_output([sys.executable, "-c", code], text=True).split()
+
+
+@pytest.mark.parametrize("module", ["koan.workflows", "koan.batch", "koan.replot"])
+def test_entry_points_do_not_import_heavy_dependencies(module):
+    assert set(_imported(module)) <= {"sklearn"}
+
+
+def test_cli_does_not_import_sklearn():
+    assert _imported("koan.cli") == []
+
+
+def test_workflows_keeps_the_deprecation_warnings():
+    code = (
+        "import warnings, koan.workflows\n"
+        "from koan.borda_importance import Bordas\n"
+        "with warnings.catch_warnings(record=True) as caught:\n"
+        "    try:\n"
+        "        Bordas()['df']\n"
+        "    except KeyError:\n"
+        "        pass\n"
+        "print(caught[0].category.__name__)"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert output.split() == ["DeprecationWarning"]
@@ -0,0 +1,45 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pytest
+from koan.ingest import columnar_cache, load_columnar, load_dataset
+
+
+@pytest.fixture
+def csvfile(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "gene": rng.normal(size=50),
+            "count": rng.integers(0, 100, 50),
+            "site": rng.choice(["a", "b"], 50),
+        },
+        index=pd.Index([f"s{i}" for i in range(50)], name="sample"),
+    )
+    path = tmp_path / "data.csv"
+    df.to_csv(path)
+    return str(path)
+
+
+def test_load_dataset_round_trips_through_the_columnar_cache(csvfile, tmp_path):
+    expected = pd.read_csv(csvfile, index_col=0)
+    cache_dir = str(tmp_path / "cache")
+    for _ in range(2):
+        df = load_dataset(csvfile, int_columns=["count"], cache_dir=cache_dir)
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False, atol=1e-6)
+        assert df["gene"].dtype == np.float32
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_concurrent_columnar_caches_share_one_complete_copy(csvfile, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    with ProcessPoolExecutor(4) as executor:
+        futures = [
+            executor.submit(columnar_cache, csvfile, cache_dir, ["count"])
+            for _ in range(8)
+        ]
+        (directory,) = {future.result() for future in futures}
+    # No partial or temporary copies are left behind
+    assert os.listdir(cache_dir) == [os.path.basename(directory)]
+    assert load_columnar(directory).shape == (50, 3)
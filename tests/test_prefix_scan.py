@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
+from sklearn.linear_model import LogisticRegression
+from sklearn.neighbors import KNeighborsClassifier
+from koan.prefix_scan import KNNPrefixScan, LDAPrefixScan, LogisticPrefixScan
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, 2, 300)
+    X = rng.normal(size=(300, 6)) + y[:, None] * np.linspace(0.2, 1.2, 6)
+    return X[:200], y[:200], X[200:]
+
+
+def test_lda_prefix_scan_matches_sklearn(data):
+    X_train, y_train, X_test = data
+    scans = list(LDAPrefixScan().scan(X_train, y_train, X_test))
+    assert len(scans) == X_train.shape[1]
+    for k, (y_pred, proba) in enumerate(scans, 1):
+        lda = LinearDiscriminantAnalysis().fit(X_train[:, :k], y_train)
+        np.testing.assert_allclose(proba, lda.predict_proba(X_test[:, :k]), atol=1e-8)
+        np.testing.assert_array_equal(y_pred, lda.predict(X_test[:, :k]))
+
+
+def test_lda_prefix_scan_skips_collinear_features(data):
+    X_train, y_train, X_test = data
+    # The third column is a copy of the first, it adds nothing
+    X_train = np.insert(X_train, 2, X_train[:, 0], axis=1)
+    X_test = np.insert(X_test, 2, X_test[:, 0], axis=1)
+    scans = [proba for _, proba in LDAPrefixScan().scan(X_train, y_train, X_test)]
+    np.testing.assert_allclose(scans[2], scans[1])
+
+
+def test_logistic_prefix_scan_matches_sklearn(data):
+    X_train, y_train, X_test = data
+    scans = list(LogisticPrefixScan().scan(X_train, y_train, X_test))
+    for k, (y_pred, proba) in enumerate(scans, 1):
+        lrc = LogisticRegression().fit(X_train[:, :k], y_train)
+        # Warm started, the solver stops at a slightly different point
+        np.testing.assert_allclose(proba, lrc.predict_proba(X_test[:, :k]), atol=2e-3)
+        np.testing.assert_array_equal(y_pred, lrc.predict(X_test[:, :k]))
+
+
+def test_knn_prefix_scan_matches_sklearn(data):
+    X_train, y_train, X_test = data
+    scans = list(KNNPrefixScan(n_neighbors=7).scan(X_train, y_train, X_test))
+    for k, (y_pred, proba) in enumerate(scans, 1):
+        knn = KNeighborsClassifier(n_neighbors=7).fit(X_train[:, :k], y_train)
+        np.testing.assert_array_equal(proba, knn.predict_proba(X_test[:, :k]))
+        np.testing.assert_array_equal(y_pred, knn.predict(X_test[:, :k]))
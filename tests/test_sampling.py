@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from koan.sampling import sample_indices
+
+
+@pytest.fixture
+def y():
+    return np.array([0] * 70 + [1] * 30)
+
+
+def test_undersampling_is_seeded_and_balanced(y):
+    rows = sample_indices(y, "undersampling", random_state=1)
+    np.testing.assert_array_equal(rows, sample_indices(y, "undersampling", 1))
+    assert not np.array_equal(rows, sample_indices(y, "undersampling", 2))
+    assert np.bincount(y[rows]).tolist() == [30, 30]
+    assert np.all(np.diff(rows) > 0)
+
+
+def test_no_sampling_keeps_every_row(y):
+    np.testing.assert_array_equal(sample_indices(y, "no"), np.arange(len(y)))
+
+
+def test_unknown_sampling(y):
+    with pytest.raises(ValueError, match="Not existing typos"):
+        sample_indices(y, "smote")
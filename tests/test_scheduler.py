@@ -0,0 +1,67 @@
+import time
+import pytest
+from koan.scheduler import Stage, run_stages
+
+
+def value(x):
+    return x
+
+
+def add(a, b):
+    return a + b
+
+
+STAGES = [
+    Stage("sum", add, deps={"a": "one", "b": "two"}),
+    Stage("two", add, deps={"a": "one", "b": "one"}),
+    Stage("one", value, (1,)),
+]
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_run_stages_follows_dependencies(max_workers):
+    results, timeline = run_stages(STAGES, max_workers=max_workers)
+    assert results == {"one": 1, "two": 2, "sum": 3}
+    end = {entry["stage"]: entry["end"] for entry in timeline}
+    start = {entry["stage"]: entry["start"] for entry in timeline}
+    assert end["one"] <= start["two"] and end["two"] <= start["sum"]
+
+
+def test_run_stages_rejects_unknown_and_circular_dependencies():
+    with pytest.raises(ValueError, match="unknown"):
+        run_stages([Stage("a", value, deps={"x": "b"})], max_workers=1)
+    circular = [Stage("a", value, deps={"x": "b"}), Stage("b", value, deps={"x": "a"})]
+    with pytest.raises(ValueError, match="circular"):
+        run_stages(circular, max_workers=1)
+
+
+def pair(x):
+    return {"double": 2 * x, "triple": 3 * x}
+
+
+def test_run_stages_passes_one_item_of_a_dict_result():
+    stages = [
+        Stage("pair", pair, (2,)),
+        Stage("sum", add, deps={"a": ("pair", "double"), "b": ("pair", "triple")}),
+    ]
+    results, _ = run_stages(stages, max_workers=1)
+    assert results["sum"] == 10
+
+
+def parallel_sum(n):
+    from joblib import Parallel, delayed
+
+    return sum(Parallel(n_jobs=2)(delayed(value)(i) for i in range(n)))
+
+
+def fail(x):
+    raise RuntimeError("stage failed")
+
+
+def test_run_stages_releases_the_loky_workers_after_a_failure():
+    stages = [Stage("sum", parallel_sum, (4,)), Stage("fail", fail, deps={"x": "sum"})]
+    start = time.time()
+    with pytest.raises(RuntimeError, match="stage failed"):
+        run_stages(stages, max_workers=2)
+    # The idle loky workers would otherwise hold up the pool exit for minutes
+    assert time.time() - start < 60